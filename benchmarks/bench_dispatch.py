@@ -0,0 +1,48 @@
+"""Application.f_ round-trips per second, with the previous lookup, the dispatch table and a resolved handle.
+
+    python -m benchmarks.bench_dispatch
+"""
+import time
+from unittest.mock import patch
+from centaur.applications import Application, Adapter
+
+
+class PingAdapter(Adapter):
+    async def ping(self):
+        return True
+
+    async def pong(self):
+        return await self.app.f_('ping.ping')
+
+
+def _old_lookup_name(self, name):
+    adapter_name, attrib_name = name.split('.')
+    return getattr(self.adapters[adapter_name], attrib_name)
+
+
+def bench(n_calls=200000):
+    app = Application(adapters={'ping': PingAdapter})
+    pong = app.resolve('ping.pong')
+
+    async def _f_calls():
+        for _ in range(n_calls):
+            await app.f_('ping.pong')
+
+    async def _resolved_calls():
+        for _ in range(n_calls):
+            await pong()
+
+    def _rate(coro_fn):
+        start = time.perf_counter()
+        app.event_loop.run_until_complete(coro_fn())
+        return n_calls / (time.perf_counter() - start)
+
+    with patch.object(Application, 'lookup_name', _old_lookup_name):
+        old = _rate(_f_calls)
+    return old, _rate(_f_calls), _rate(_resolved_calls)
+
+
+if __name__ == '__main__':
+    old, table, resolved = bench()
+    print('f_ round-trips/s  split+getattr: {:,.0f}  dispatch table: {:,.0f}  resolved handle: {:,.0f}'.format(
+        old, table, resolved))
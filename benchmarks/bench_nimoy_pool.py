@@ -0,0 +1,64 @@
+"""Concurrent get_item throughput: NimoyAdapter (thread offload, one connection) vs PooledNimoyAdapter.
+
+Both run against in-process fake databases with 1ms latency per call, the blocking one
+serializes calls on its single connection like a real driver does.
+
+    python -m benchmarks.bench_nimoy_pool
+"""
+import asyncio
+import threading
+import time
+from centaur.applications import Application
+from centaur.contrib import NimoyAdapter, PooledNimoyAdapter
+
+
+class BlockingDatabase(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def get_item(self, schema_name, _id):
+        with self._lock:
+            time.sleep(0.001)
+            return {'_id': _id}
+
+
+class AsyncDatabase(object):
+    async def get_item(self, schema_name, _id):
+        await asyncio.sleep(0.001)
+        return {'_id': _id}
+
+
+class ThreadOffloadAdapter(NimoyAdapter):
+    def create_connection(self):
+        return BlockingDatabase()
+
+
+class PooledAdapter(PooledNimoyAdapter):
+    def create_connection(self):
+        return AsyncDatabase()
+
+
+def _throughput(app, n_calls, concurrency):
+    async def _worker(ids):
+        for _id in ids:
+            await app.f_('nimoy.get_item', schema_name='book', _id=_id)
+
+    async def _run():
+        await asyncio.gather(*[_worker(range(i, n_calls, concurrency)) for i in range(concurrency)])
+
+    start = time.perf_counter()
+    app.event_loop.run_until_complete(_run())
+    return n_calls / (time.perf_counter() - start)
+
+
+def bench(n_calls=2000, concurrency=50, pool_size=16):
+    offload = _throughput(Application(adapters={'nimoy': ThreadOffloadAdapter}), n_calls, concurrency)
+    pooled = _throughput(Application(config={'nimoy_pool': {'size': pool_size}},
+                                     adapters={'nimoy': PooledAdapter}), n_calls, concurrency)
+    return offload, pooled
+
+
+if __name__ == '__main__':
+    offload, pooled = bench()
+    print('get_item/s  thread offload: {:,.0f}  pooled: {:,.0f}  speedup: {:.1f}x'.format(
+        offload, pooled, pooled / offload))
@@ -0,0 +1,70 @@
+"""Peak memory of exporting a large table: NimoyAdapter.query (one list) vs query_iter (pages).
+
+The fake database generates the items of each page on demand like a real driver does, so the
+peak is what the adapter holds on to, not the table itself.
+
+    python -m benchmarks.bench_nimoy_stream
+"""
+import asyncio
+import time
+import tracemalloc
+from centaur.applications import Application
+from centaur.contrib import PooledNimoyAdapter
+
+
+class PagingDatabase(object):
+    def __init__(self, n_items):
+        self.n_items = n_items
+
+    async def query(self, schema_name, _w, limit):
+        await asyncio.sleep(0)
+        return self._items(0, limit)
+
+    async def query_page(self, schema_name, _w, page_size, cursor):
+        await asyncio.sleep(0)
+        start = cursor or 0
+        end = start + page_size
+        return self._items(start, end), (end if end < self.n_items else None)
+
+    def _items(self, start, end):
+        return [{'_id': i, 'title': 'book {}'.format(i), 'tags': ['a', 'b']}
+                for i in range(start, min(end, self.n_items))]
+
+
+def _app(n_items):
+    class _Adapter(PooledNimoyAdapter):
+        def create_connection(self):
+            return PagingDatabase(n_items)
+
+    return Application(adapters={'nimoy': _Adapter})
+
+
+def _measure(app, export):
+    tracemalloc.start()
+    start = time.perf_counter()
+    n_exported = app.event_loop.run_until_complete(export())
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return n_exported, elapsed, peak
+
+
+def bench(n_items=200000, page_size=1000, prefetch=2):
+    app = _app(n_items)
+
+    async def _materialized():
+        return sum(1 for _ in await app.f_('nimoy.query', schema_name='book', _w=None, limit=n_items))
+
+    async def _streamed():
+        n_exported = 0
+        async for _ in await app.f_('nimoy.query_iter', schema_name='book', _w=None,
+                                    page_size=page_size, prefetch=prefetch):
+            n_exported += 1
+        return n_exported
+
+    return _measure(app, _materialized), _measure(app, _streamed)
+
+
+if __name__ == '__main__':
+    for name, (n_exported, elapsed, peak) in zip(['query', 'query_iter'], bench()):
+        print('{:<10}  {:,} items  {:.2f}s  peak {:,.1f} MiB'.format(name, n_exported, elapsed, peak / 2 ** 20))
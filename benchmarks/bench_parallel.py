@@ -0,0 +1,30 @@
+"""Validating a large list of dicts serially vs with ParallelListValidator.
+
+    python -m benchmarks.bench_parallel
+"""
+import time
+from centaur import datatypes as dt
+
+
+def bench(n_items=1000000):
+    users_dt = dt.load_module({'datatypes': {
+        'user': {'type': 'dict', 'fields': {'email': {'type': 'centaur:email'}, 'age': {'type': 'integer', 'gte': 0}}},
+        'users': {'type': 'list', 'items': {'type': 'user'}},
+    }})['users']
+    users = [{'email': 'user{}@example.com'.format(i), 'age': i} for i in range(n_items)]
+
+    start = time.perf_counter()
+    users_dt.guard(users)
+    serial = time.perf_counter() - start
+
+    with dt.ParallelListValidator(users_dt) as validator:
+        validator.guard(users[:validator.min_size])  # start the workers
+        start = time.perf_counter()
+        validator.guard(users)
+        parallel = time.perf_counter() - start
+    return serial, parallel
+
+
+if __name__ == '__main__':
+    serial, parallel = bench()
+    print('1M items  serial: {:.3f}s  parallel: {:.3f}s  speedup: {:.1f}x'.format(serial, parallel, serial / parallel))
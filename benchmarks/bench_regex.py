@@ -0,0 +1,47 @@
+"""Regex validation: raw re.match vs patterns precompiled on the datatype.
+
+    python -m benchmarks.bench_regex
+"""
+import re
+import timeit
+from centaur import datatypes as dt
+from centaur.datatypes.defaults import EMAIL_REGEX
+
+
+def bench_many_patterns(n_patterns=1000, number=20):
+    # more distinct patterns than the re module caches
+    patterns = ['^item-{}-[a-z]+$'.format(i) for i in range(n_patterns)]
+    values = ['item-{}-abc'.format(i) for i in range(n_patterns)]
+    dts = [dt.def_datatype({'type': 'string', 'regex': p}) for p in patterns]
+
+    def _raw():
+        for p, v in zip(patterns, values):
+            re.match(p, v)
+
+    def _datatype():
+        for d, v in zip(dts, values):
+            d.validate_regex(v, d._options['regex'])
+
+    return timeit.timeit(_raw, number=number), timeit.timeit(_datatype, number=number)
+
+
+def bench_email(number=20000):
+    email_dt = dt.load_module({'datatypes': {}})['centaur:email']
+    values = ['john.doe@example.com', 'not an email address at all']
+
+    def _raw():
+        for v in values:
+            re.match(EMAIL_REGEX, v)
+
+    def _datatype():
+        for v in values:
+            email_dt.validate_regex(v, EMAIL_REGEX)
+
+    return timeit.timeit(_raw, number=number), timeit.timeit(_datatype, number=number)
+
+
+if __name__ == '__main__':
+    for name, bench in [('1000 distinct patterns', bench_many_patterns), ('default email', bench_email)]:
+        raw, precompiled = bench()
+        print('{:<24} re.match: {:.3f}s  precompiled: {:.3f}s  speedup: {:.1f}x'.format(
+            name, raw, precompiled, raw / precompiled))
@@ -0,0 +1,52 @@
+"""Loading modules and decorating functions with a fresh default context each time vs the shared one.
+
+    python -m benchmarks.bench_startup
+"""
+import subprocess
+import sys
+import timeit
+from unittest.mock import patch
+from centaur import datatypes as dt
+from centaur.datatypes import context, defaults
+
+
+def bench_import(number=5):
+    cmd = [sys.executable, '-c', 'from centaur import datatypes as dt; dt.load_module({"datatypes": {}})']
+    return timeit.timeit(lambda: subprocess.check_call(cmd), number=number) / number
+
+
+def _rebuilt_vs_shared(fn, number):
+    """Times fn with the shared default context and with a new one built on every use (the old behaviour)."""
+    fn()
+    shared = timeit.timeit(fn, number=number)
+    with patch.object(defaults, 'get_default_ctx', defaults._create_default_ctx), \
+            patch.object(context, 'get_default_ctx', defaults._create_default_ctx):
+        rebuilt = timeit.timeit(fn, number=number)
+    return rebuilt, shared
+
+
+def bench_load_modules(n_modules=200, number=5):
+    definitions = [{'name': 'm{}'.format(i), 'datatypes': {'owner': {'type': 'centaur:email'}}}
+                   for i in range(n_modules)]
+
+    def _load():
+        for d in definitions:
+            dt.load_module(d)
+
+    return _rebuilt_vs_shared(_load, number)
+
+
+def bench_decorate(n_functions=200, number=5):
+    def _decorate():
+        for _ in range(n_functions):
+            dt.validate_args(lambda email: email, email='email')
+
+    return _rebuilt_vs_shared(_decorate, number)
+
+
+if __name__ == '__main__':
+    print('{:<24} {:.3f}s'.format('import + first module', bench_import()))
+    for name, bench in [('load 200 modules', bench_load_modules), ('decorate 200 functions', bench_decorate)]:
+        rebuilt, shared = bench()
+        print('{:<24} rebuilt ctx: {:.3f}s  shared ctx: {:.3f}s  speedup: {:.1f}x'.format(
+            name, rebuilt, shared, rebuilt / shared))
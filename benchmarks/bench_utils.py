@@ -0,0 +1,56 @@
+"""fill_defaults and deep_merge compared to their previous implementations.
+
+    python -m benchmarks.bench_utils
+"""
+import timeit
+from copy import deepcopy
+from centaur.utils import fill_defaults, deep_merge, deep_merge_shared
+
+
+def _old_fill_defaults(dict_, defaults):
+    def _iter_keys_once(dicts):
+        _yielded = []
+        for d in dicts:
+            for k in d.keys():
+                if k not in _yielded:
+                    _yielded.append(k)
+                    yield k
+    return {k: dict_[k] if dict_.get(k) is not None else defaults[k] for k in _iter_keys_once([dict_, defaults])}
+
+
+def _old_deep_merge(d1, d2):
+    ret = deepcopy(d1)
+    for k, v in d2.items():
+        if k in ret and isinstance(ret[k], dict):
+            ret[k] = _old_deep_merge(ret[k], v)
+        else:
+            ret[k] = deepcopy(v)
+    return ret
+
+
+def _tree(depth, width, leaf):
+    if depth == 0:
+        return leaf
+    return {'k{}'.format(i): _tree(depth - 1, width, leaf) for i in range(width)}
+
+
+def bench_fill_defaults(n_keys=5000, number=5):
+    data = {'k{}'.format(i): i for i in range(0, n_keys, 2)}
+    defaults = {'k{}'.format(i): 0 for i in range(n_keys)}
+    return (timeit.timeit(lambda: _old_fill_defaults(data, defaults), number=number),
+            timeit.timeit(lambda: fill_defaults(data, defaults), number=number))
+
+
+def bench_deep_merge(number=5):
+    d1, d2 = _tree(5, 6, [1, 2, 3]), {'k0': _tree(4, 6, 'x')}
+    return (timeit.timeit(lambda: _old_deep_merge(d1, d2), number=number),
+            timeit.timeit(lambda: deep_merge(d1, d2), number=number),
+            timeit.timeit(lambda: deep_merge_shared(d1, d2), number=number))
+
+
+if __name__ == '__main__':
+    old, new = bench_fill_defaults()
+    print('fill_defaults 5000 keys  old: {:.3f}s  new: {:.3f}s  speedup: {:.1f}x'.format(old, new, old / new))
+    old, new, shared = bench_deep_merge()
+    print('deep_merge 9331 nodes    old: {:.3f}s  new: {:.3f}s  shared: {:.4f}s  speedup: {:.1f}x / {:.0f}x'.format(
+        old, new, shared, old / new, old / shared))
@@ -0,0 +1,25 @@
+"""Overhead of validate_args compared to calling the undecorated function.
+
+    python -m benchmarks.bench_validate_args
+"""
+import timeit
+from centaur import datatypes as dt
+
+
+def add(a, b, scale=1):
+    return (a + b) * scale
+
+
+def bench(number=100000):
+    decorated = dt.validate_args(add, a={'type': 'integer'}, b={'type': 'integer', 'gte': 0},
+                                 scale={'type': 'number'})
+    plain = timeit.timeit(lambda: add(1, 2, scale=3), number=number)
+    validated = timeit.timeit(lambda: decorated(1, 2, scale=3), number=number)
+    return plain, validated
+
+
+if __name__ == '__main__':
+    number = 100000
+    plain, validated = bench(number)
+    print('undecorated: {:.3f}s  validate_args: {:.3f}s  overhead: {:.2f}us/call'.format(
+        plain, validated, (validated - plain) / number * 1e6))
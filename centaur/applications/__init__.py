@@ -1,5 +1,8 @@
 import asyncio
 import functools
+import inspect
+from types import MappingProxyType
+from .executors import ExecutorPool, PoolFullError
 
 
 class Adapter(object):
@@ -12,8 +15,11 @@ class Application(object):
     def __init__(self, config=None, adapters=None):
         self.config = config or {}
         adapters = adapters or {}
+        self.executors = {name: ExecutorPool(name, **pool_config)
+                          for name, pool_config in self.config.get('executors', {}).items()}
         self.adapters = {aname: acls(self) for aname, acls in adapters.items()}
         self.event_loop = self._get_event_loop()
+        self._refresh_dispatch_table()
 
     def _get_event_loop(self):
         policy = asyncio.get_event_loop_policy()
@@ -22,13 +28,45 @@ class Application(object):
         policy.set_event_loop(event_loop)
         return event_loop
 
+    def _refresh_dispatch_table(self):
+        """'adapter.method' -> (adapter name, adapter, method name, bound method) for public coroutine methods.
+
+        Helpers which are not coroutine methods are left out. An entry is used only while its method is not
+        replaced on the adapter or on its class, patched methods are looked up with getattr.
+        """
+        self._dispatched_adapters = dict(self.adapters)
+        self._dispatch = MappingProxyType({
+            '{}.{}'.format(aname, name): (aname, adapter, name, getattr(adapter, name))
+            for aname, adapter in self.adapters.items()
+            for name, _ in inspect.getmembers(type(adapter), inspect.iscoroutinefunction) if not name.startswith('_')})
+
     def lookup_name(self, name):
+        entry = self._dispatch.get(name)
+        if entry is not None:
+            aname, adapter, fn_name, method = entry
+            if (self.adapters.get(aname) is adapter and fn_name not in adapter.__dict__
+                    and getattr(type(adapter), fn_name, None) is getattr(method, '__func__', method)):
+                return method
+        if self.adapters != self._dispatched_adapters:
+            self._refresh_dispatch_table()
         adapter_name, attrib_name = name.split('.')
         return getattr(self.adapters[adapter_name], attrib_name)
 
+    def resolve(self, fn_name):
+        """The function behind fn_name, to be kept by callers calling it repeatedly."""
+        return self.lookup_name(fn_name)
+
     async def f_(self, fn_name, **kwargs):
-        coro = self.lookup_name(fn_name)
-        return await coro(**kwargs)
+        """Calls fn_name, awaiting its result if it is awaitable, e.g. not for async iterators."""
+        ret = self.lookup_name(fn_name)(**kwargs)
+        return await ret if inspect.isawaitable(ret) else ret
+
+    async def run_in_executor(self, fn, *args, _pool=None, **kwargs):
+        """Runs fn in the executor pool named _pool, the 'default' pool or the default executor of the loop."""
+        if _pool is None and 'default' not in self.executors:
+            return await self.event_loop.run_in_executor(None, functools.partial(fn, *args, **kwargs))
+        return await self.executors[_pool or 'default'].run(self.event_loop, fn, *args, **kwargs)
 
-    async def run_in_executor(self, fn, *args, **kwargs):
-        return await self.event_loop.run_in_executor(None, functools.partial(fn, *args, **kwargs))
+    def shutdown_executors(self, wait=True):
+        for pool in self.executors.values():
+            pool.shutdown(wait=wait)
@@ -0,0 +1,96 @@
+import asyncio
+import functools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+
+class PoolFullError(Exception):
+    pass
+
+
+class ExecutorPool(object):
+    """Named pool of threads or processes with a bounded queue, configured in `Application.config['executors']`.
+
+    When `max_queue` calls are waiting for a worker, further calls wait for a free slot
+    (`on_full='wait'`) or are rejected with PoolFullError (`on_full='reject'`).
+    Functions and arguments sent to a `kind='process'` pool are pickled, so they can not be
+    bound methods of objects holding connections or locks.
+    """
+    def __init__(self, name, max_workers=None, max_queue=None, kind='thread', on_full='wait'):
+        if kind not in ('thread', 'process') or on_full not in ('wait', 'reject'):
+            raise ValueError("Invalid executor pool config for {}: {} {}".format(name, kind, on_full))
+        self.name = name
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+        self.max_queue = max_queue
+        self.kind = kind
+        self.on_full = on_full
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+        self._executor = None
+        self._slot_freed = None
+
+    @property
+    def active(self):
+        return min(self.in_flight, self.max_workers)
+
+    @property
+    def queued(self):
+        return self.in_flight - self.active
+
+    def metrics(self):
+        return {
+            'active': self.active,
+            'queued': self.queued,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'queue_wait_avg': self.queue_wait_total / self.completed if self.completed else 0.0,
+            'queue_wait_max': self.queue_wait_max,
+        }
+
+    async def run(self, loop, fn, *args, **kwargs):
+        await self._acquire()
+        self.in_flight += 1
+        try:
+            submitted = time.monotonic()
+            started, result = await loop.run_in_executor(
+                self._get_executor(), functools.partial(_timed_call, fn, args, kwargs))
+            wait = max(started - submitted, 0.0)
+            self.completed += 1
+            self.queue_wait_total += wait
+            self.queue_wait_max = max(self.queue_wait_max, wait)
+            return result
+        finally:
+            self.in_flight -= 1
+            if self._slot_freed is not None:
+                async with self._slot_freed:
+                    self._slot_freed.notify()
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    async def _acquire(self):
+        if self.max_queue is None or self.in_flight < self.max_workers + self.max_queue:
+            return
+        if self.on_full == 'reject':
+            self.rejected += 1
+            raise PoolFullError("Executor pool {} is full ({} queued)".format(self.name, self.queued))
+        self._slot_freed = self._slot_freed or asyncio.Condition()
+        async with self._slot_freed:
+            await self._slot_freed.wait_for(lambda: self.in_flight < self.max_workers + self.max_queue)
+
+    def _get_executor(self):
+        if self._executor is None:
+            executor_cls = ThreadPoolExecutor if self.kind == 'thread' else ProcessPoolExecutor
+            self._executor = executor_cls(max_workers=self.max_workers)
+        return self._executor
+
+
+def _timed_call(fn, args, kwargs):
+    # time.monotonic is system wide on the supported platforms, so it works for process pools too
+    return time.monotonic(), fn(*args, **kwargs)
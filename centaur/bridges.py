@@ -1,10 +1,13 @@
 import datetime
 import decimal
 import json
+import logging
 from aiohttp import web
 from centaur.utils import select_params_for_fn
 from centaur.datatypes import ValidationError, ItemNotFoundError
 
+logger = logging.getLogger(__name__)
+
 
 class BaseBridge(object):
     def __init__(self, application):
@@ -30,15 +33,16 @@ class HTTPBridge(BaseBridge):
         async def _handler(request):
             kwargs = await create_ctx_from_request(request)
             coro = self._app.lookup_name(fn_name)
-            print(select_params_for_fn(kwargs, coro))
             try:
                 res = await self._app.f_(fn_name, **select_params_for_fn(kwargs, coro))
-                if not isinstance(res, web.Response):
+                if hasattr(res, '__aiter__'):
+                    return await stream_response(request, res)
+                elif not isinstance(res, web.Response):
                     return web.Response(text=to_json(res), content_type='application/json')
                 else:
                     return res
             except ValidationError as res:
-                return web.Response(text=to_json({'error': str(res)}), content_type='application/json', status=400)
+                return web.Response(text=to_json(validation_error_report(res)), content_type='application/json', status=400)
             except ItemNotFoundError as res:
                 return web.Response(text=to_json({'error': str(res)}), content_type='application/json', status=404)
         return _handler
@@ -61,6 +65,72 @@ class HTTPBridge(BaseBridge):
             loop.close()
 
 
+async def stream_response(request, items, chunk_size=2 ** 16):
+    """Streams an async iterator of items as chunked response.
+
+    NDJSON, one item per line, unless the client accepts application/json but not
+    application/x-ndjson, then a JSON array. Items are sent as soon as chunk_size bytes are pending.
+    Errors before the first item are raised, later ones end the stream: with an error record as
+    last line of NDJSON, with the JSON array left unclosed.
+    """
+    iterator = items.__aiter__()
+    try:
+        item = await _next_item(iterator)
+        accept = request.headers.get('Accept', '')
+        ndjson = 'application/x-ndjson' in accept or 'application/json' not in accept
+        response = web.StreamResponse(headers={
+            'Content-Type': 'application/x-ndjson' if ndjson else 'application/json'})
+        response.enable_chunked_encoding()
+        await response.prepare(request)
+        pending, n_pending = [] if ndjson else ['['], 0
+        separator = '\n' if ndjson else ','
+        first, error = True, None
+        try:
+            while item is not _end_of_items:
+                text = to_json(item)
+                pending.append(text + separator if ndjson else (text if first else separator + text))
+                first = False
+                n_pending += len(text) + 1
+                if n_pending >= chunk_size:
+                    await response.write(''.join(pending).encode())
+                    pending, n_pending = [], 0
+                item = await _next_item(iterator)
+        except ConnectionError:
+            raise  # the client is gone
+        except Exception as e:
+            logger.exception("Streaming response of %s failed", request.path)
+            error = e
+        if error is None and not ndjson:
+            pending.append(']')
+        elif error is not None and ndjson:
+            report = validation_error_report(error) if isinstance(error, ValidationError) else {'error': str(error)}
+            pending.append(to_json(report) + '\n')
+        if pending:
+            await response.write(''.join(pending).encode())
+        await response.write_eof()
+        return response
+    finally:
+        if hasattr(iterator, 'aclose'):
+            await iterator.aclose()
+
+
+_end_of_items = object()
+
+
+async def _next_item(iterator):
+    try:
+        return await iterator.__anext__()
+    except StopAsyncIteration:
+        return _end_of_items
+
+
+def validation_error_report(error):
+    report = {'error': str(error)}
+    if error.errors:
+        report['errors'] = [e._asdict() for e in error.errors]
+    return report
+
+
 async def create_ctx_from_request(request):
     async def _request_data(request):
         try:
@@ -1,40 +1,259 @@
+import asyncio
+from itertools import islice
 import centaur
 from centaur.safe_import import safe_import
+from .batching import BatchLoader
+from .caching import AsyncCache
+from .pool import ConnectionPool
 
 
 DatabaseConnection = safe_import('nimoy.connection', 'DatabaseConnection', msg='Plz. install nimoy package for this Adapter')
 
 
-class NimoyAdapter(centaur.Adapter):
+class _NimoyMethods(object):
     def __init__(self, application):
         super().__init__(application)
+        # method name -> name of the executor pool it runs in, e.g. {'scan': 'slow'}
+        self.pools = self.app.config.get('nimoy_pools', {})
+        for method_name, pool_name in self.pools.items():
+            if pool_name not in self.app.executors:
+                raise ValueError("Unknown executor pool {} for nimoy method {}".format(pool_name, method_name))
+        for pool_name in set(self.pools.values()) | {'default'}:
+            pool = self.app.executors.get(pool_name)
+            if pool is not None and pool.kind == 'process':
+                # the methods of the connection can not be pickled to another process
+                raise ValueError("Nimoy methods can not run in the process pool {}".format(pool_name))
+        # coalescing of concurrent get_item calls, e.g. {'max_batch_size': 100, 'window': 0.001}
+        self.batching = self.app.config.get('nimoy_batching')
+        self._loaders = {}
+        # read-through cache of get_item, e.g. {'max_entries': 10000, 'max_bytes': 2 ** 26, 'ttl': 60}
+        cache_config = self.app.config.get('nimoy_cache')
+        self.cache = AsyncCache(**cache_config) if cache_config is not None else None
+
+    def create_connection(self):
         nimoy_config = self.app.config.get('nimoy_config', {})
         nimoy_schemas = self.app.config.get('nimoy_schemas', {})
-        self.db = DatabaseConnection(schema=nimoy_schemas, **nimoy_config)
+        return DatabaseConnection(schema=nimoy_schemas, **nimoy_config)
 
     async def get_item(self, schema_name, _id, **kw):
-        return await self.app.run_in_executor(
-            self.db.get_item, schema_name, _id, **kw)
+        if self.cache is not None and not kw:
+            return await self.cache.get_or_load((schema_name, _id), lambda: self._get_item(schema_name, _id))
+        return await self._get_item(schema_name, _id, **kw)
+
+    async def _get_item(self, schema_name, _id, **kw):
+        if self.batching is not None and not kw:
+            return await self._loader_for(schema_name).load(_id)
+        return await self._call('get_item', schema_name, _id, **kw)
+
+    async def batch_get_items(self, schema_name, _ids, **kw):
+        """Items for _ids, errors of single items are returned in their place."""
+        return await self._call('batch_get_items', schema_name, _ids, **kw)
+
+    async def put_items(self, schema_name, _items, **kw):
+        max_batch_size = (self.batching or {}).get('max_batch_size', 100)
+        ret = []
+        for i in range(0, len(_items), max_batch_size):
+            try:
+                ret.extend(await self._call('put_items', schema_name, _items[i:i + max_batch_size], **kw))
+            finally:
+                self._invalidate(schema_name, *[item.get('_id') for item in _items[i:i + max_batch_size]])
+        for result in ret:
+            if isinstance(result, Exception):
+                raise result
+        return ret
 
     async def put_item(self, schema_name, _data, **kw):
-        return await self.app.run_in_executor(
-            self.db.put_item, schema_name, _data, **kw)
+        try:
+            return await self._call('put_item', schema_name, _data, **kw)
+        finally:
+            self._invalidate(schema_name, _data.get('_id'))
 
     async def delete_item(self, schema_name, _id, **kw):
-        return await self.app.run_in_executor(
-            self.db.delete_item, schema_name, _id, **kw)
+        try:
+            return await self._call('delete_item', schema_name, _id, **kw)
+        finally:
+            self._invalidate(schema_name, _id)
 
     async def query(self, schema_name, _w, limit=500, **kw):
-        return await self.app.run_in_executor(
-            self.db.query, schema_name, _w, limit, **kw)
+        return await self._call('query', schema_name, _w, limit, **kw)
 
     async def query_count(self, schema_name, _w, **kw):
-        return await self.app.run_in_executor(
-            self.db.query_count, schema_name, _w, **kw)
+        return await self._call('query_count', schema_name, _w, **kw)
 
     async def scan(self, schema_name, _w, limit=500, **kw):
-        return await self.app.run_in_executor(
-            self.db.scan, schema_name, _w, limit, **kw)
+        return await self._call('scan', schema_name, _w, limit, **kw)
+
+    def query_iter(self, schema_name, _w, page_size=500, prefetch=1, **kw):
+        """Async iterator over all items of the query, fetched page_size items at a time.
+
+        Up to `prefetch` pages are fetched ahead of the consumer, so memory stays bounded by
+        (prefetch + 1) * page_size items however many items the query has. Pages come from
+        `query_page(schema_name, _w, page_size, cursor, **kw)` of the connections, returning the items
+        and the cursor of the next page, None after the last one, the first page is fetched with cursor
+        None. Connections without it are read page_size items at a time from the lazy result of
+        `query(schema_name, _w, None, **kw)`.
+        """
+        return _prefetched(self._pages('query_page', schema_name, _w, page_size, **kw), prefetch)
+
+    def scan_iter(self, schema_name, _w, page_size=500, prefetch=1, **kw):
+        """Like query_iter, with `scan_page` or `scan` of the connections."""
+        return _prefetched(self._pages('scan_page', schema_name, _w, page_size, **kw), prefetch)
 
     async def uuid(self):
-        return await self.app.run_in_executor(self.db.uuid)
+        return await self._call('uuid')
+
+    async def _pages(self, method_name, schema_name, _w, page_size, **kw):
+        cursor = None
+        while True:
+            items, cursor = await self._call(method_name, schema_name, _w, page_size, cursor, **kw)
+            if items:
+                yield items
+            if cursor is None:
+                return
+
+    def _invalidate(self, schema_name, *_ids):
+        loader = self._loaders.get(schema_name)
+        for _id in _ids:
+            if self.cache is not None:
+                self.cache.invalidate((schema_name, _id))
+            if loader is not None:
+                loader.forget(_id)
+
+    def _loader_for(self, schema_name):
+        if schema_name not in self._loaders:
+            self._loaders[schema_name] = BatchLoader(
+                lambda _ids: self.batch_get_items(schema_name, _ids), **self.batching)
+        return self._loaders[schema_name]
+
+
+class NimoyAdapter(_NimoyMethods, centaur.Adapter):
+    def __init__(self, application):
+        super().__init__(application)
+        self.db = self.create_connection()
+
+    async def _call(self, method_name, *args, **kw):
+        return await self.app.run_in_executor(
+            _db_method(self.db, method_name), *args, _pool=self.pools.get(method_name), **kw)
+
+
+class PooledNimoyAdapter(_NimoyMethods, centaur.Adapter):
+    """NimoyAdapter using a pool of connections, configured by `config['nimoy_pool']`.
+
+    Coroutine methods of the connections are awaited directly, blocking ones still run in the
+    executor pools of the application but every call has a connection of its own.
+    """
+    def __init__(self, application):
+        super().__init__(application)
+        pool_config = self.app.config.get('nimoy_pool', {})
+        self.connection_pool = ConnectionPool(
+            self.create_connection, size=pool_config.get('size', 4), max_idle=pool_config.get('max_idle', 300),
+            check=pool_config.get('check'))
+
+    async def _call(self, method_name, *args, **kw):
+        async with self.connection_pool.connection() as db:
+            fn = _db_method(db, method_name)
+            if asyncio.iscoroutinefunction(fn):
+                return await fn(*args, **kw)
+            return await self.app.run_in_executor(fn, *args, _pool=self.pools.get(method_name), **kw)
+
+
+async def _prefetched(pages, prefetch):
+    """Items of the async iterator of pages, fetching up to prefetch pages ahead in a task."""
+    if prefetch < 1:
+        try:
+            async for page in pages:
+                for item in page:
+                    yield item
+        finally:
+            await pages.aclose()
+        return
+    queue = asyncio.Queue()
+    room = asyncio.Semaphore(prefetch)
+    done = object()
+
+    async def _fetch():
+        try:
+            while True:
+                await room.acquire()
+                try:
+                    page = await pages.__anext__()
+                except StopAsyncIteration:
+                    break
+                queue.put_nowait(page)
+        except Exception as e:
+            queue.put_nowait(e)
+        else:
+            queue.put_nowait(done)
+
+    task = asyncio.ensure_future(_fetch())
+    try:
+        while True:
+            page = await queue.get()
+            if page is done:
+                return
+            elif isinstance(page, Exception):
+                raise page
+            room.release()
+            for item in page:
+                yield item
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await pages.aclose()
+
+
+# batch methods of connections without them, calling the single item method per item
+_BATCH_FALLBACKS = {'batch_get_items': 'get_item', 'put_items': 'put_item'}
+# paging methods of connections without them, reading the lazy result of query/scan
+_PAGING_FALLBACKS = {'query_page': 'query', 'scan_page': 'scan'}
+
+
+def _db_method(db, method_name):
+    if method_name in _BATCH_FALLBACKS and not hasattr(db, method_name):
+        return _batched(getattr(db, _BATCH_FALLBACKS[method_name]))
+    elif method_name in _PAGING_FALLBACKS and not hasattr(db, method_name):
+        return _paged(getattr(db, _PAGING_FALLBACKS[method_name]))
+    return getattr(db, method_name)
+
+
+def _paged(fn):
+    # the cursor is the iterator of the rest of the result, limit None reads all the items;
+    # with a pool the iterator keeps reading through the connection of the first page
+    if asyncio.iscoroutinefunction(fn):
+        async def _page(schema_name, _w, page_size, cursor, **kw):
+            if cursor is None:
+                cursor = iter(await fn(schema_name, _w, None, **kw))
+            return _next_page(cursor, page_size)
+    else:
+        def _page(schema_name, _w, page_size, cursor, **kw):
+            if cursor is None:
+                cursor = iter(fn(schema_name, _w, None, **kw))
+            return _next_page(cursor, page_size)
+    return _page
+
+
+def _next_page(items, page_size):
+    page = list(islice(items, page_size))
+    return page, (items if len(page) == page_size else None)
+
+
+def _batched(fn):
+    if asyncio.iscoroutinefunction(fn):
+        async def _batch(schema_name, items, **kw):
+            ret = []
+            for item in items:
+                try:
+                    ret.append(await fn(schema_name, item, **kw))
+                except Exception as e:
+                    ret.append(e)
+            return ret
+    else:
+        def _batch(schema_name, items, **kw):
+            ret = []
+            for item in items:
+                try:
+                    ret.append(fn(schema_name, item, **kw))
+                except Exception as e:
+                    ret.append(e)
+            return ret
+    return _batch
@@ -0,0 +1,85 @@
+import asyncio
+
+
+class BatchLoader(object):
+    """Coalesces concurrent `load(key)` calls into calls of `batch_fn(keys)`.
+
+    Keys requested within `window` seconds, or until `max_batch_size` keys are pending, are loaded
+    together, a key already pending or in flight is loaded only once. `batch_fn` is a coroutine
+    function returning one result per key, exceptions in the results are raised to their callers.
+    """
+    def __init__(self, batch_fn, max_batch_size=100, window=0.001):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.window = window
+        self.batches = 0
+        self._pending = {}
+        self._in_flight = {}
+        self._flush_handle = None
+        self._tasks = set()
+
+    async def load(self, key):
+        future = self._pending.get(key) or self._in_flight.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._pending[key] = loop.create_future()
+            if len(self._pending) >= self.max_batch_size:
+                self._flush()
+            elif self._flush_handle is None:
+                self._flush_handle = loop.call_later(self.window, self._flush)
+        return await asyncio.shield(future)
+
+    async def load_many(self, keys):
+        return await asyncio.gather(*[self.load(key) for key in keys])
+
+    def forget(self, key):
+        """Loads of key after this call start a new batch, e.g. after key was written.
+
+        Callers already waiting for a batch in flight still get its result.
+        """
+        self._in_flight.pop(key, None)
+
+    def close(self):
+        """Cancels pending and in flight loads."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, {}
+        for future in batch.values():
+            future.cancel()
+        for task in list(self._tasks):
+            task.cancel()
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            self._in_flight.update(batch)
+            self.batches += 1
+            task = asyncio.ensure_future(self._load_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _load_batch(self, batch):
+        results = None
+        try:
+            results = await self.batch_fn(list(batch))
+            if len(results) != len(batch):
+                raise ValueError("Batch function returned {} results for {} keys".format(len(results), len(batch)))
+        except Exception as e:
+            results = [e] * len(batch)
+        finally:
+            # results is None when cancelled, the callers are cancelled too
+            for (key, future), result in zip(batch.items(), results or [None] * len(batch)):
+                if self._in_flight.get(key) is future:
+                    del self._in_flight[key]
+                if future.done():
+                    continue
+                elif results is None:
+                    future.cancel()
+                elif isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
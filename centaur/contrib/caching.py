@@ -0,0 +1,82 @@
+import asyncio
+import sys
+import time
+from collections import OrderedDict
+
+
+class AsyncCache(object):
+    """Read-through LRU cache with TTL for coroutines, bounded by entries and (approximate) bytes.
+
+    Concurrent misses of a key share one load, `invalidate(key)` drops the entry and any load in
+    flight so a value read before a write is never stored. Cached values are shared between
+    callers and must not be mutated.
+    """
+    def __init__(self, max_entries=10000, max_bytes=None, ttl=60, timer=time.monotonic):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size = 0
+        self._timer = timer
+        self._entries = OrderedDict()
+        self._loading = {}
+
+    async def get_or_load(self, key, load):
+        entry = self._entries.get(key)
+        if entry is not None:
+            if self.ttl is None or entry[0] > self._timer():
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry[1]
+            self._remove(key)
+            self.evictions += 1
+        self.misses += 1
+        future = self._loading.get(key)
+        if future is None:
+            future = self._loading[key] = asyncio.ensure_future(load())
+            future.add_done_callback(lambda f: self._loaded(key, f))
+        return await asyncio.shield(future)
+
+    def invalidate(self, key):
+        self._loading.pop(key, None)
+        if key in self._entries:
+            self._remove(key)
+
+    def clear(self):
+        self._loading.clear()
+        self._entries.clear()
+        self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _loaded(self, key, future):
+        if self._loading.get(key) is not future:
+            return  # invalidated while loading
+        del self._loading[key]
+        if future.cancelled() or future.exception() is not None:
+            return
+        value = future.result()
+        nbytes = _approx_size(value) if self.max_bytes is not None else 0
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (None if self.ttl is None else self._timer() + self.ttl, value, nbytes)
+        self.size += nbytes
+        while self._entries and (len(self._entries) > self.max_entries or
+                                 (self.max_bytes is not None and self.size > self.max_bytes)):
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key):
+        self.size -= self._entries.pop(key)[2]
+
+
+def _approx_size(value):
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_approx_size(k) + _approx_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(_approx_size(v) for v in value)
+    return size
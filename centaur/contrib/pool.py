@@ -0,0 +1,113 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+
+async def _maybe_await(value):
+    return await value if asyncio.iscoroutine(value) else value
+
+
+class ConnectionPool(object):
+    """Keeps up to `size` connections created by `create`, most recently used first.
+
+    Idle connections older than `max_idle` seconds are closed, `check(conn)` (optional, may be a
+    coroutine function) is called before a connection is handed out and unhealthy ones are replaced.
+    """
+    def __init__(self, create, size=4, max_idle=300, check=None, timer=time.monotonic):
+        self.create = create
+        self.size = size
+        self.max_idle = max_idle
+        self.check = check
+        self.created = 0
+        self.evicted = 0
+        self._timer = timer
+        self._idle = deque()
+        self._n_connections = 0
+        self._released = None
+
+    @property
+    def in_use(self):
+        return self._n_connections - len(self._idle)
+
+    async def acquire(self):
+        self._released = self._released or asyncio.Condition()
+        while True:
+            self._evict_idle()
+            if self._idle:
+                conn, _ = self._idle.pop()
+                if self.check is None:
+                    return conn
+                healthy = False
+                try:
+                    healthy = await _maybe_await(self.check(conn))
+                except Exception:
+                    pass  # a failing check is an unhealthy connection
+                finally:
+                    if not healthy:  # also when cancelled while checking
+                        await self._discard(conn)
+                if healthy:
+                    return conn
+            elif self._n_connections < self.size:
+                self._n_connections += 1
+                try:
+                    conn = await _maybe_await(self.create())
+                except BaseException:
+                    self._n_connections -= 1
+                    raise
+                self.created += 1
+                return conn
+            else:
+                async with self._released:
+                    await self._released.wait()
+
+    async def release(self, conn, discard=False):
+        if discard:
+            await self._discard(conn)
+        else:
+            self._idle.append((conn, self._timer()))
+            await self._notify()
+
+    @asynccontextmanager
+    async def connection(self):
+        conn = await self.acquire()
+        try:
+            yield conn
+        except (ConnectionError, OSError):
+            await self.release(conn, discard=True)
+            raise
+        except BaseException:
+            await self.release(conn)
+            raise
+        else:
+            await self.release(conn)
+
+    async def close(self):
+        while self._idle:
+            await self._discard(self._idle.pop()[0])
+
+    def _evict_idle(self):
+        deadline = self._timer() - self.max_idle
+        while self._idle and self._idle[0][1] < deadline:
+            conn, _ = self._idle.popleft()
+            self.evicted += 1
+            self._n_connections -= 1
+            close = getattr(conn, 'close', None)
+            if close is not None and not asyncio.iscoroutinefunction(close):
+                close()
+            elif close is not None:
+                asyncio.ensure_future(close())
+
+    async def _discard(self, conn):
+        self._n_connections -= 1
+        try:
+            close = getattr(conn, 'close', None)
+            if close is not None:
+                await _maybe_await(close())
+        finally:
+            await self._notify()
+
+    async def _notify(self):
+        if self._released is not None:
+            async with self._released:
+                self._released.notify()
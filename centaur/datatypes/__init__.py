@@ -1,7 +1,9 @@
 from .context import _Context, _Module
 from .decorators import validate_args, validate_args_with_ctx
-from .exceptions import ValidationError, ItemNotFoundError
+from .exceptions import ValidationError, ItemNotFoundError, ErrorItem
 from .classes import _Datatype
+from .streaming import validate_stream, StreamItem
+from .parallel import ParallelListValidator
 
 
 def def_datatypes(dt_definitions, _ctx=None):
@@ -30,8 +32,21 @@ def guard(value, datatype):
     return datatype.guard(value)
 
 
-__all__ = ['def_datatypes', 'def_datatype', 'load_module', 'fulfill', 'guard',
+def guard_patch(original_valid, patch, datatype):
+    return datatype.guard_patch(original_valid, patch)
+
+
+def fulfill_many(values, datatype):
+    return datatype.fulfill_many(values)
+
+
+def guard_many(values, datatype):
+    return datatype.guard_many(values)
+
+
+__all__ = ['def_datatypes', 'def_datatype', 'load_module', 'fulfill', 'guard', 'guard_patch',
+           'fulfill_many', 'guard_many', 'validate_stream', 'StreamItem', 'ParallelListValidator',
            '_Context', '_Module', '_Datatype',
            'validate_args', 'validate_args_with_ctx',
-           'ValidationError', 'ItemNotFoundError'
+           'ValidationError', 'ItemNotFoundError', 'ErrorItem'
            ]
@@ -0,0 +1,83 @@
+import threading
+import time
+from collections import OrderedDict
+from .exceptions import ValidationError
+
+
+_SCALARS = (str, int, float, bool, bytes, type(None))
+
+
+class ValidationCache(object):
+    """LRU cache of guard results for dict and list payloads, see `_Context.enable_validation_cache`.
+
+    Entries are keyed by the datatype, the version of its context and a copy of the content
+    made of tuples, so mutating a payload after validation can not produce a stale hit.
+    """
+    def __init__(self, maxsize=1024, ttl=None, timer=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._timer = timer
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def guard(self, datatype, value):
+        content = _content_key(value) if isinstance(value, (dict, list)) else None
+        if content is None:
+            return datatype.compile()(value)
+        key = (datatype, datatype._ctx._version, content)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] is not None and entry[0] <= self._timer():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+        if entry is None:
+            try:
+                datatype.compile()(value)
+                error = None
+            except ValidationError as e:
+                error = (e.args, e.errors)
+            entry = (None if self.ttl is None else self._timer() + self.ttl, error)
+            with self._lock:
+                self._entries[key] = entry
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        if entry[1] is not None:
+            raise ValidationError(*entry[1][0], errors=entry[1][1])
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _content_key(value):
+    """Hashable copy of value, None if it contains anything but dicts, lists, tuples and scalars."""
+    if isinstance(value, _SCALARS):
+        return type(value), value
+    elif isinstance(value, dict):
+        items = []
+        for k, v in value.items():
+            k, v = _content_key(k), _content_key(v)
+            if k is None or v is None:
+                return None
+            items.append((k, v))
+        return dict, tuple(items)
+    elif isinstance(value, (list, tuple)):
+        items = []
+        for v in value:
+            v = _content_key(v)
+            if v is None:
+                return None
+            items.append(v)
+        return type(value), tuple(items)
+    return None
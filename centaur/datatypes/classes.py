@@ -1,8 +1,11 @@
 from .mixins import EnumValidationMixin, ContainsValidationMixin, LengthValidationMixin,\
     EqualityValidationMixin, RegexValidationMixin, SortableValidationMixin, ItemsValidationMixin,\
     FieldsValidationMixin
-from centaur.utils import without_items, deep_merge
-from .exceptions import ValidationError
+import threading
+from functools import partial
+from types import MappingProxyType
+from centaur.utils import without_items, deep_merge_shared
+from .exceptions import ValidationError, ErrorItem
 
 
 class _Datatype(object):
@@ -10,10 +13,20 @@ class _Datatype(object):
         self._options = options
         self._ctx = _ctx
         self.name = name
+        self._compiled = None
+        self._compiled_version = None
+
+    def __getstate__(self):
+        # compiled validators are closures, they are recompiled after unpickling
+        return dict(self.__dict__, _compiled=None, _compiled_version=None)
 
     def get_options(self):
         return self._options
 
+    def _merged_options(self):
+        """Options including those of base datatypes, shared, not to be modified."""
+        return self._options
+
     def validate_type(self, value):
         return True
 
@@ -37,6 +50,9 @@ class _Datatype(object):
             return False
 
     def guard(self, value, options=None):
+        if options is None and self._ctx.validation_cache is not None:
+            return self._ctx.validation_cache.guard(self, value)
+
         def _validate_option(value, option, opt):
             validate_fn = getattr(self, 'validate_{}'.format(option))
             if validate_fn(value, opt):
@@ -49,6 +65,109 @@ class _Datatype(object):
         else:
             raise ValidationError("Invalid type for {}. Value: {}".format(self.__class__.__name__, repr(value)))
 
+    def validate(self, value, collect_all=False, path=''):
+        """Returns the ErrorItems of value, an empty list if it is valid.
+
+        Only the first error is reported unless collect_all, nested paths look like 'a.b[0]'."""
+        errors = []
+        self._collect_errors(value, path, errors, collect_all)
+        return errors
+
+    def _collect_errors(self, value, path, errors, collect_all, options=None):
+        options = options or self.get_options()
+        if not self.validate_type(value):
+            errors.append(ErrorItem(path, 'type', self.__class__.__name__, value))
+            return
+        for option in options:
+            if errors and not collect_all:
+                return
+            if hasattr(self, 'collect_{}'.format(option)):
+                getattr(self, 'collect_{}'.format(option))(value, options[option], path, errors, collect_all)
+                continue
+            try:
+                valid = getattr(self, 'validate_{}'.format(option))(value, options[option])
+            except ValidationError:
+                valid = False
+            if not valid:
+                errors.append(ErrorItem(path, option, _expected(options[option]), value))
+
+    def guard_many(self, values, options=None):
+        """Validates the values option by option.
+
+        Returns True or the ValidationError guard would raise for each value. Unlike guard, which
+        raises KeyError for a field of a dict not in its fields option, a ValidationError is
+        returned for such a value, so one bad item does not fail the whole batch."""
+        def _validate_many(option, opt, values):
+            if hasattr(self, 'many_{}'.format(option)):
+                return getattr(self, 'many_{}'.format(option))(values, opt)
+            validate_fn = getattr(self, 'validate_{}'.format(option))
+
+            def _validate(value):
+                try:
+                    return validate_fn(value, opt)
+                except ValidationError as e:
+                    return e
+            return [_validate(value) for value in values]
+
+        values = values.tolist() if hasattr(values, 'tolist') else list(values)
+        options = options or self.get_options()
+        results = [True if self.validate_type(value) else ValidationError(
+            "Invalid type for {}. Value: {}".format(self.__class__.__name__, repr(value))) for value in values]
+        for option in options:
+            pending = [i for i, r in enumerate(results) if r is True]
+            if not pending:
+                break
+            for i, valid in zip(pending, _validate_many(option, options[option], [values[i] for i in pending])):
+                if isinstance(valid, ValidationError):
+                    results[i] = valid
+                elif not valid:
+                    results[i] = ValidationError(self.get_exception_msg(
+                        option_name=option, option_value=options[option], value=values[i]))
+        return results
+
+    def fulfill_many(self, values, options=None):
+        return [r is True for r in self.guard_many(values, options=options)]
+
+    def compile(self):
+        """Returns a validator function equivalent to guard, with a fulfill attribute."""
+        compiled = self._compiled
+        if compiled is not None and self._compiled_version == self._ctx._version:
+            return compiled
+        with _compile_lock:
+            if id(self) in _compiling:  # recursive datatype, being compiled further up the stack
+                return _compiling[id(self)]
+            if self._compiled is None or self._compiled_version != self._ctx._version:
+                version = self._ctx._version
+                _compiling[id(self)] = _deferred_validator(self)
+                try:
+                    compiled = self._compile_guard()
+                finally:
+                    del _compiling[id(self)]
+                self._compiled, self._compiled_version = compiled, version
+            return self._compiled
+
+    def _compile_guard(self, options=None):
+        def _compile_option(option, opt):
+            if hasattr(self, 'compile_{}'.format(option)):
+                return getattr(self, 'compile_{}'.format(option))(opt)
+            elif hasattr(self, 'validate_{}'.format(option)):
+                return partial(getattr(self, 'validate_{}'.format(option)), opt=opt)
+            return lambda value: getattr(self, 'validate_{}'.format(option))(value, opt)
+
+        options = options or self.get_options()
+        checks = [(option, options[option], _compile_option(option, options[option])) for option in options]
+        validate_type = self.validate_type
+        type_error_template = "Invalid type for {}. Value: {{}}".format(self.__class__.__name__)
+
+        def guard(value):
+            if not validate_type(value):
+                raise ValidationError(type_error_template.format(repr(value)))
+            for option, opt, check in checks:
+                if not check(value):
+                    raise ValidationError(self.get_exception_msg(option_name=option, option_value=opt, value=value))
+            return True
+        return _validator(guard)
+
 
 class NoneDatatype(_Datatype):
     def validate_type(self, value):
@@ -84,19 +203,93 @@ class DictDataType(FieldsValidationMixin, LengthValidationMixin, _Datatype):
     def validate_type(self, value):
         return isinstance(value, dict)
 
+    def guard_patch(self, original_valid, patch, options=None):
+        """Validates deep_merge(original_valid, patch) for a valid original, returns the merged dict.
+
+        Only the fields in patch are validated, the other options are checked on the merged dict."""
+        options = options or self.get_options()
+        if not self.validate_type(patch):
+            raise ValidationError("Invalid type for {}. Value: {}".format(self.__class__.__name__, repr(patch)))
+        merged = dict(original_valid)
+        for key, value in patch.items():
+            if 'fields' in options:
+                merged[key] = _guard_patch(options['fields'][key], original_valid.get(key), value)
+            else:
+                merged[key] = _merge_patch(original_valid.get(key), value)
+        for option in options:
+            if option != 'fields' and not getattr(self, 'validate_{}'.format(option))(merged, options[option]):
+                raise ValidationError(self.get_exception_msg(
+                    option_name=option, option_value=options[option], value=merged))
+        return merged
+
 
 class ExtendedDataType(_Datatype):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._resolved = None
+
+    def __getstate__(self):
+        # the read only view of the options can not be pickled, resolved again after unpickling
+        return dict(super().__getstate__(), _resolved=None)
+
     def fulfill(self, value, options=None):
-        base_dt = self._ctx[self._options['type']]
-        return base_dt.fulfill(value, options=without_items(options or self.get_options(), ['type']))
+        base_dt, _, base_options = self._resolve()
+        return base_dt.fulfill(value, options=without_items(options, ['type']) if options else base_options)
 
     def guard(self, value, options=None):
-        base_dt = self._ctx[self._options['type']]
-        return base_dt.guard(value, options=without_items(options or self.get_options(), ['type']))
+        base_dt, _, base_options = self._resolve()
+        if options is None and self._ctx.validation_cache is not None:
+            return self._ctx.validation_cache.guard(self, value)
+        return base_dt.guard(value, options=without_items(options, ['type']) if options else base_options)
+
+    def guard_many(self, values, options=None):
+        base_dt, _, base_options = self._resolve()
+        return base_dt.guard_many(values, options=without_items(options, ['type']) if options else base_options)
+
+    def fulfill_many(self, values, options=None):
+        base_dt, _, base_options = self._resolve()
+        return base_dt.fulfill_many(values, options=without_items(options, ['type']) if options else base_options)
 
     def get_options(self):
-        base_dt = self._ctx[self._options['type']]
-        return deep_merge(base_dt.get_options(), self._options)
+        self._resolve()
+        return self._resolved[4]
+
+    def _merged_options(self):
+        return self._resolve()[1]
+
+    def guard_patch(self, original_valid, patch, options=None):
+        base_dt, _, base_options = self._resolve()
+        options = without_items(options, ['type']) if options else base_options
+        if hasattr(base_dt, 'guard_patch'):
+            return base_dt.guard_patch(original_valid, patch, options=options)
+        merged = _merge_patch(original_valid, patch)
+        base_dt.guard(merged, options=options)
+        return merged
+
+    def _collect_errors(self, value, path, errors, collect_all, options=None):
+        base_dt, _, base_options = self._resolve()
+        base_dt._collect_errors(value, path, errors, collect_all,
+                                options=without_items(options, ['type']) if options else base_options)
+
+    def _resolve(self):
+        """Base datatype, merged options and the options passed to the base datatype.
+
+        Cached for the current version of the context, with the read only view of the merged options."""
+        if self._resolved is None or self._resolved[0] != self._ctx._version:
+            base_dt = self._ctx[self._options['type']]
+            options = deep_merge_shared(base_dt._merged_options(), self._options)
+            self._resolved = (self._ctx._version, base_dt, options, without_items(options, ['type']),
+                              _read_only(options))
+        return self._resolved[1:4]
+
+    def _compile_guard(self, options=None):
+        try:
+            base_dt, _, base_options = self._resolve()
+            if options is None and list(self._options) == ['type']:
+                return base_dt.compile()
+            return base_dt._compile_guard(options=without_items(options, ['type']) if options else base_options)
+        except (KeyError, ValueError):  # unknown base datatype, fail at validation time like guard
+            return _validator(partial(self.guard, options=options))
 
 
 class UnionDatatype(_Datatype):
@@ -106,7 +299,84 @@ class UnionDatatype(_Datatype):
                 return True
         return False
 
+    def many_types(self, values, opt):
+        ret = [False] * len(values)
+        for t in opt:
+            pending = [i for i, r in enumerate(ret) if not r]
+            if not pending:
+                break
+            for i, r in zip(pending, t.fulfill_many([values[i] for i in pending])):
+                ret[i] = r
+        return ret
+
+    def compile_types(self, opt):
+        fulfills = [t.compile().fulfill for t in opt]
+        return lambda value: any(fulfill(value) for fulfill in fulfills)
+
 
 class MaybeDatatype(_Datatype):
     def validate_base(self, value, opt):
         return value is None or opt.fulfill(value)
+
+    def many_base(self, values, opt):
+        ret = [value is None for value in values]
+        pending = [i for i, r in enumerate(ret) if not r]
+        for i, r in zip(pending, opt.fulfill_many([values[i] for i in pending])):
+            ret[i] = r
+        return ret
+
+    def collect_base(self, value, opt, path, errors, collect_all):
+        if value is not None:
+            opt._collect_errors(value, path, errors, collect_all)
+
+    def compile_base(self, opt):
+        fulfill = opt.compile().fulfill
+        return lambda value: value is None or fulfill(value)
+
+
+def _merge_patch(original, patch):
+    return deep_merge_shared(original, patch) if isinstance(original, dict) and isinstance(patch, dict) else patch
+
+
+def _guard_patch(datatype, original, patch):
+    if isinstance(original, dict) and isinstance(patch, dict) and hasattr(datatype, 'guard_patch'):
+        return datatype.guard_patch(original, patch)
+    merged = _merge_patch(original, patch)
+    datatype.compile()(merged)
+    return merged
+
+
+def _expected(opt):
+    """Option value of an ErrorItem, datatypes are given by name."""
+    if isinstance(opt, _Datatype):
+        return opt.name
+    elif isinstance(opt, (list, tuple)) and any(isinstance(o, _Datatype) for o in opt):
+        return [_expected(o) for o in opt]
+    return opt
+
+
+def _validator(guard):
+    def fulfill(value):
+        try:
+            return guard(value)
+        except ValidationError:
+            return False
+    guard.fulfill = fulfill
+    return guard
+
+
+# compilation is serialized, the placeholders of datatypes being compiled are only seen by the
+# compiling thread, others wait for the finished validator
+_compile_lock = threading.RLock()
+_compiling = {}
+
+
+def _read_only(options):
+    return MappingProxyType({k: _read_only(v) if isinstance(v, dict) else v for k, v in options.items()})
+
+
+def _deferred_validator(datatype):
+    def guard(value):
+        return datatype._compiled(value)
+    guard.fulfill = lambda value: datatype._compiled.fulfill(value)
+    return guard
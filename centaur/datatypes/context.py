@@ -1,9 +1,11 @@
 import yaml
+import weakref
 from centaur.utils import without_items, IDGenerator
 from .classes import StringDatatype, NumberDataType, IntegerDataType, DictDataType, \
     ListDatatype, NoneDatatype, ExtendedDataType, UnionDatatype, MaybeDatatype, \
     BooleanDataType
-from .defaults import _create_default_ctx
+from .defaults import get_default_ctx
+from .cache import ValidationCache
 
 
 class _Types(object):
@@ -43,11 +45,38 @@ class _Context(YMLFileLoadMixin, object):
         self.linked_ctxs = {}
         self.id_generator = IDGenerator()
         self.error_templates = {}
+        self._version = 0
+        self._frozen = False
+        self._linked_by = weakref.WeakSet()
+        self._base = None
+        self.validation_cache = None
+
+    def __getstate__(self):
+        state = dict(self.__dict__, validation_cache=None)
+        del state['_linked_by']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._linked_by = weakref.WeakSet()
 
     @classmethod
     def create_empty(cls):
         return cls()
 
+    def enable_validation_cache(self, maxsize=1024, ttl=None):
+        """Caches the results of guard for dict and list values validated by datatypes of this context."""
+        self.validation_cache = ValidationCache(maxsize=maxsize, ttl=ttl)
+        return self.validation_cache
+
+    def overlay(self):
+        """Empty context that looks up missing datatypes in this one, new datatypes stay in the overlay."""
+        ctx = self.create_empty()
+        ctx._base = self
+        ctx.error_templates = dict(self.error_templates)
+        self._linked_by.add(ctx)
+        return ctx
+
     @classmethod
     def from_dict(cls, d):
         ctx = cls()
@@ -95,23 +124,60 @@ class _Context(YMLFileLoadMixin, object):
             self.id_generator.generate_id(dt_definition.get('type'))
 
     def add_datatype(self, name, datatype):
+        self._ensure_not_frozen()
         self._datatypes[name] = datatype
+        self._changed()
         return datatype
 
     def link_ctx(self, ctx, prefix):
+        self._ensure_not_frozen()
         self.linked_ctxs[prefix] = ctx
+        ctx._linked_by.add(self)
+        self._changed()
         return self
 
+    @property
+    def frozen(self):
+        return self._frozen
+
+    def freeze(self):
+        """Resolves and compiles every datatype once, further changes are not allowed."""
+        if not self._frozen:
+            self._frozen = True
+            for ctx in self.linked_ctxs.values():
+                ctx.freeze()
+            for name, datatype in self.items():
+                datatype.compile()
+        return self
+
+    def _ensure_not_frozen(self):
+        if self._frozen:
+            raise TypeError("Frozen context can not be modified")
+
+    def _changed(self, _seen=None):
+        # Cached options and validators are valid for one version of the context,
+        # contexts linking this one are changed as well.
+        _seen = _seen or set()
+        if id(self) not in _seen:
+            _seen.add(id(self))
+            self._version += 1
+            for ctx in list(self._linked_by):
+                ctx._changed(_seen)
+
     def items(self):
         return ((k, v) for k, v in self._datatypes.items())
 
     def __getitem__(self, key):
         splitted_key = key.rsplit(':', 1)
         if len(splitted_key) == 1:
-            return self._datatypes[key]
+            if key in self._datatypes or self._base is None:
+                return self._datatypes[key]
+            return self._base[key]
         elif len(splitted_key) == 2:
             if splitted_key[0] in self.linked_ctxs:
                 return self.linked_ctxs[splitted_key[0]][splitted_key[1]]
+            elif self._base is not None:
+                return self._base[key]
             else:  # noqa
                 raise ValueError("Unknown prefix: {} for datatype {}".format(*splitted_key))
 
@@ -145,7 +211,7 @@ class _Module(YMLFileLoadMixin, object):
         ns = d.get('ns', None)
         datatypes = d.get('datatypes')
         ctx = _Context.from_dict(datatypes)
-        ctx.link_ctx(_create_default_ctx(), prefix='centaur')
+        ctx.link_ctx(get_default_ctx(), prefix='centaur')
         return cls(name=name, ns=ns, ctx=ctx)
 
     def items(self):
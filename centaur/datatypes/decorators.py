@@ -1,8 +1,18 @@
+import asyncio
+import functools
 import inspect
 from centaur.utils import wraps_w_signature
+from .exceptions import ValidationError
 
 
-def validate_args_with_ctx(ctx=None, **kwargs):
+def validate_args_with_ctx(ctx=None, offload_above=None, executor=None, **kwargs):
+    """Validates the arguments of `fn` on every call.
+
+    Coroutine functions get an async wrapper. With `offload_above` set, the arguments of
+    coroutine functions having more nested items than that are validated with `executor`
+    (`Application.run_in_executor` of the adapter for adapter methods) off the event loop.
+    The offloaded call only takes picklable arguments, so process pools work too.
+    """
 
     def _add_default_param_values(ba, sig):
         for param in sig.parameters.values():
@@ -13,11 +23,8 @@ def validate_args_with_ctx(ctx=None, **kwargs):
     def _param_is_not_empty(p):
         return p.annotation is not inspect._empty
 
-    def _param_is_not_default(p, ba):
-        return ba.arguments[p.name] != p.default
-
     def _construct_ctx(ctx):
-        from .defaults import _create_default_ctx
+        from .defaults import get_default_ctx
         from .context import _Module, _Context
 
         if isinstance(ctx, _Module):
@@ -25,58 +32,155 @@ def validate_args_with_ctx(ctx=None, **kwargs):
         elif isinstance(ctx, _Context):
             _ctx = ctx
         elif ctx is None:
-            _ctx = _create_default_ctx()
+            _ctx = get_default_ctx().overlay()
         else:
             raise ValueError("Unknown ctx" + ctx)  # noqa
         return _ctx
 
-    def _construct_datatype(dt_):
+    def _resolve_datatype(dt_):
+        """Datatype of dt_ and None, or None and a lookup of a named datatype.
+
+        Definitions are defined once (in an overlay of a frozen ctx), errors are raised here.
+        Names are looked up on the calls, again after the ctx changed, so they may be defined
+        or redefined later."""
         from .classes import _Datatype
 
         if isinstance(dt_, _Datatype):
-            return dt_
+            return dt_, None
         elif isinstance(dt_, dict):
-            return _ctx.def_datatype(dt_)
+            return _definitions_ctx().def_datatype(dt_), None
         else:
-            return _ctx[dt_]
+            return None, _NamedDatatype(_ctx, dt_)
 
-    def _not_default_params_with_validation(sig, ba):
-        for param in sig.parameters.values():
-            if _param_is_not_default(param, ba):
-                if _param_is_not_empty(param):
-                    dt_from_annotation = _construct_datatype(param.annotation)
-                    if dt_from_annotation is not None:
-                        yield param, dt_from_annotation
-                elif param.name in kwargs:
-                    dt_from_kwargs = _construct_datatype(kwargs[param.name])
-                    if dt_from_kwargs is not None:
-                        yield param, dt_from_kwargs
-
-    def _validate_fn_params_by_annotations(fn, *args, **kwargs):
-        sig = inspect.signature(fn)
-        bound_arguments = _add_default_param_values(sig.bind(*args, **kwargs), sig)
-        validation_results = [
-            datatype_.guard(
-                bound_arguments.arguments[param.name])
-            for param, datatype_ in _not_default_params_with_validation(sig, bound_arguments)]
-        return validation_results
+    def _definitions_ctx():
+        nonlocal _overlay
+        if not _ctx.frozen:
+            return _ctx
+        _overlay = _overlay or _ctx.overlay()
+        return _overlay
+
+    def _validation_plan(sig):
+        plan = []
+        for position, param in enumerate(sig.parameters.values()):
+            if _param_is_not_empty(param):
+                dt_ = param.annotation
+            elif param.name in kwargs:
+                dt_ = kwargs[param.name]
+            else:
+                continue
+            plan.append((position, param.name, param.default) + _resolve_datatype(dt_))
+        return plan
 
     def _decorator(fn):
+        sig = inspect.signature(fn)
+        plan = _validation_plan(sig)
+        params = list(sig.parameters.values())
+        positions = {p.name: position for position, p in enumerate(params)}
+        n_positional = len([p for p in params if p.kind == p.POSITIONAL_OR_KEYWORD])
+        simple_sig = all(p.kind in (p.POSITIONAL_OR_KEYWORD, p.KEYWORD_ONLY) for p in params)
+
+        def _is_simple_call(args, kwargs):
+            return simple_sig and len(args) <= n_positional and all(
+                positions.get(k, -1) >= len(args) for k in kwargs)
+
+        def _checks(args, kwargs):
+            """(datatype, name, value) of the arguments to validate."""
+            if _is_simple_call(args, kwargs):
+                values = ((args[position] if position < len(args) else kwargs.get(name, default))
+                          for position, name, default, _, _ in plan)
+            else:
+                bound_arguments = _add_default_param_values(sig.bind(*args, **kwargs), sig)
+                values = (bound_arguments.arguments[name] for _, name, _, _, _ in plan)
+            return [(datatype or lookup(), name, value)
+                    for (_, name, default, datatype, lookup), value in zip(plan, values) if value != default]
+
+        if asyncio.iscoroutinefunction(fn):
+            @wraps_w_signature(fn)
+            async def async_wrapper(*args, **kwargs):
+                if offload_above is not None and \
+                        _payload_exceeds(args + tuple(kwargs.values()), offload_above):
+                    await _executor_for(args)(_validate_values, _checks(args, kwargs))
+                else:
+                    _validate_values(_checks(args, kwargs))
+                return await fn(*args, **kwargs)
+            return async_wrapper
+
         @wraps_w_signature(fn)
         def wrapper(*args, **kwargs):
-            _validate_fn_params_by_annotations(fn, *args, **kwargs)
-            result = fn(*args, **kwargs)
-            return result
+            _validate_values(_checks(args, kwargs))
+            return fn(*args, **kwargs)
         return wrapper
 
+    def _executor_for(args):
+        # adapter methods offload to their application, found duck-typed to keep datatypes
+        # independent of centaur.applications
+        run_in_executor = getattr(getattr(args[0], 'app', None), 'run_in_executor', None) if args else None
+        return executor or run_in_executor or _run_in_default_executor
+
     _ctx = _construct_ctx(ctx)
+    _overlay = None
     return _decorator
 
 
 def validate_args(fn=None, **kwargs):
     ctx = kwargs.pop('ctx', None)
-    _decorator = validate_args_with_ctx(ctx=ctx, **kwargs)
+    offload_above = kwargs.pop('offload_above', None)
+    executor = kwargs.pop('executor', None)
+    _decorator = validate_args_with_ctx(ctx=ctx, offload_above=offload_above, executor=executor, **kwargs)
     if fn is None:
         return _decorator
     else:
         return _decorator(fn)
+
+
+class _NamedDatatype(object):
+    """Looks up a datatype by name, once per version of the ctx."""
+    def __init__(self, ctx, name):
+        self._ctx = ctx
+        self._name = name
+        self._version = None
+        self._datatype = None
+
+    def __call__(self):
+        if self._version != self._ctx._version:
+            self._datatype = self._ctx[self._name]
+            self._version = self._ctx._version
+        return self._datatype
+
+
+def _validate_values(checks):
+    for datatype, name, value in checks:
+        try:
+            datatype.compile()(value)
+        except ValidationError as e:
+            e.errors = datatype.validate(value, collect_all=True, path=name)
+            raise
+        except KeyError:  # unknown fields are reported as errors of the argument
+            errors = datatype.validate(value, collect_all=True, path=name)
+            unknown = [error.path for error in errors if error.option == 'fields']
+            if not unknown:
+                raise
+            raise ValidationError("Unknown fields: {}".format(', '.join(unknown)), errors=errors) from None
+
+
+async def _run_in_default_executor(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(None, functools.partial(fn, *args))
+
+
+def _payload_exceeds(values, limit):
+    """Counts the nested items of lists, tuples and dicts, stops as soon as `limit` is exceeded."""
+    count, stack = 0, [iter(values)]
+    while stack:
+        for value in stack[-1]:
+            count += 1
+            if count > limit:
+                return True
+            if isinstance(value, dict):
+                stack.append(iter(value.values()))
+                break
+            elif isinstance(value, (list, tuple)):
+                stack.append(iter(value))
+                break
+        else:
+            stack.pop()
+    return False
@@ -44,19 +44,51 @@ def _email_regex():
     return VALID_ADDRESS_REGEXP
 
 
+EMAIL_REGEX = _email_regex()
+URL_REGEX = r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\(\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+'
+DATE_REGEX = r'^(\d{4})\D?(0[1-9]|1[0-2])\D?([12]\d|0[1-9]|3[01])$'
+
+
+# cheap necessary conditions of the regexes, module level functions to keep the datatypes picklable
+def _email_precheck(value):
+    return '@' in value
+
+
+def _url_precheck(value):
+    return value.startswith('http')
+
+
+def _date_precheck(value):
+    return 8 <= len(value) <= 11  # $ matches before a trailing newline
+
+
 def _create_default_ctx():
     from .context import _Types, _Context  # beware of cycle-import!
 
     ctx_ = _Context.create_empty()
 
     ctx_.def_datatypes({
-        'email': {'type': _Types.string, 'regex': _email_regex()},
-        'url': {'type': _Types.string, 'regex': 'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\(\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+'},
-        'date': {'type': _Types.string, 'regex': '^(\d{4})\D?(0[1-9]|1[0-2])\D?([12]\d|0[1-9]|3[01])$'},
+        'email': {'type': _Types.string, 'regex': EMAIL_REGEX},
+        'url': {'type': _Types.string, 'regex': URL_REGEX},
+        'date': {'type': _Types.string, 'regex': DATE_REGEX},
         # 'datetime': {'type': _Types.string, 'regex': ''},
         })
+    ctx_['email'].set_regex_precheck(_email_precheck)
+    ctx_['url'].set_regex_precheck(_url_precheck)
+    ctx_['date'].set_regex_precheck(_date_precheck)
     ctx_.link_ctx(ctx_, prefix='centaur')
     return ctx_
 
 
-# default_ctx = _create_default_ctx()
+_default_ctx = None
+
+
+def get_default_ctx():
+    """Frozen default context shared by all modules, built on first use.
+
+    Use `get_default_ctx().overlay()` to define further datatypes on top of it.
+    """
+    global _default_ctx
+    if _default_ctx is None:
+        _default_ctx = _create_default_ctx().freeze()
+    return _default_ctx
@@ -1,5 +1,13 @@
+from collections import namedtuple
+
+
+ErrorItem = namedtuple('ErrorItem', ['path', 'option', 'expected', 'actual'])
+
+
 class ValidationError(Exception):
-    pass
+    def __init__(self, *args, errors=None):
+        super().__init__(*args)
+        self.errors = errors or []
 
 
 class ItemNotFoundError(Exception):
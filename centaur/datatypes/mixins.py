@@ -1,4 +1,24 @@
 import re
+from centaur.safe_import import safe_import, FailedImport
+from .exceptions import ErrorItem, ValidationError
+
+# optional, batches of numbers are validated vectorized with it
+np = safe_import('numpy')
+
+
+def _exact_float(x):
+    return (type(x) is float and x == x) or (type(x) is int and -2 ** 53 <= x <= 2 ** 53)
+
+
+def _field_path(path, key):
+    return '{}.{}'.format(path, key) if path else str(key)
+
+
+def _many(values, opts, vectorized, validate):
+    """vectorized(array) for numbers which are exact as float64, validate(value) otherwise."""
+    if not isinstance(np, FailedImport) and all(_exact_float(o) for o in opts) and all(_exact_float(v) for v in values):
+        return vectorized(np.asarray(values, dtype=float)).tolist()
+    return [validate(value) for value in values]
 
 
 class LengthValidationMixin(object):
@@ -26,6 +46,21 @@ class EnumValidationMixin(object):
     def validate_not_in(self, value, opt):
         return value not in opt
 
+    def many_enum(self, values, opt):
+        return self._many_in(values, opt, invert=False)
+
+    def many_in(self, values, opt):
+        return self._many_in(values, opt, invert=False)
+
+    def many_not_in(self, values, opt):
+        return self._many_in(values, opt, invert=True)
+
+    def _many_in(self, values, opt, invert):
+        members = list(opt) if isinstance(opt, (list, tuple, set, frozenset)) else [opt]
+        return _many(values, members,
+                     lambda a: np.isin(a, np.asarray(members, dtype=float), invert=invert),
+                     lambda value: (value not in opt) if invert else (value in opt))
+
 
 class ContainsValidationMixin(object):
     def validate_contains(self, value, opt):
@@ -40,6 +75,29 @@ class ItemsValidationMixin(object):
         item_dt = opt
         return all([item_dt.guard(item) for item in value])
 
+    def many_items(self, values, opt):
+        item_results = iter(opt.guard_many([item for value in values for item in value]))
+        ret = []
+        for value in values:
+            results = [next(item_results) for _ in value]
+            ret.append(next((r for r in results if r is not True), True))
+        return ret
+
+    def collect_items(self, value, opt, path, errors, collect_all):
+        for i, item in enumerate(value):
+            if errors and not collect_all:
+                return
+            opt._collect_errors(item, '{}[{}]'.format(path, i), errors, collect_all)
+
+    def compile_items(self, opt):
+        item_guard = opt.compile()
+
+        def _validate_items(value):
+            for item in value:
+                item_guard(item)
+            return True
+        return _validate_items
+
 
 class FieldsValidationMixin(object):
     def validate_fields(self, value, opt):
@@ -48,36 +106,127 @@ class FieldsValidationMixin(object):
             return key_dt.guard(value.get(key))
         return all([_validate_key(key, value) for key in value])
 
+    def many_fields(self, values, opt):
+        field_values = {}
+        for value in values:
+            for key in value:
+                field_values.setdefault(key, []).append(value[key])
+        field_results = {key: iter(opt[key].guard_many(vs)) for key, vs in field_values.items() if key in opt}
+        ret = []
+        for value in values:
+            result = True
+            for key in value:
+                if key not in field_results:
+                    if result is True:
+                        result = ValidationError("Unknown field {} in {}".format(repr(key), repr(value)))
+                    continue
+                r = next(field_results[key])
+                if result is True:
+                    result = r
+            ret.append(result)
+        return ret
+
+    def collect_fields(self, value, opt, path, errors, collect_all):
+        for key in value:
+            if errors and not collect_all:
+                return
+            elif key not in opt:
+                errors.append(ErrorItem(_field_path(path, key), 'fields', list(opt), value[key]))
+            else:
+                opt[key]._collect_errors(value[key], _field_path(path, key), errors, collect_all)
+
+    def compile_fields(self, opt):
+        field_guards = {key: key_dt.compile() for key, key_dt in opt.items()}
+
+        def _validate_fields(value):
+            for key in value:
+                field_guards[key](value[key])
+            return True
+        return _validate_fields
+
     def validate_required(self, value, opt):
         for key in opt:
             if key not in value:
                 return False
         return True
 
+    def collect_required(self, value, opt, path, errors, collect_all):
+        for key in opt:
+            if key not in value:
+                errors.append(ErrorItem(_field_path(path, key), 'required', True, None))
+                if not collect_all:
+                    return
+
 
 class SortableValidationMixin(object):
     def validate_lt(self, value, opt):
         return value < opt
 
+    def many_lt(self, values, opt):
+        return _many(values, [opt], lambda a: a < opt, lambda value: value < opt)
+
     def validate_gt(self, value, opt):
         return value > opt
 
+    def many_gt(self, values, opt):
+        return _many(values, [opt], lambda a: a > opt, lambda value: value > opt)
+
     def validate_lte(self, value, opt):
         return value <= opt
 
+    def many_lte(self, values, opt):
+        return _many(values, [opt], lambda a: a <= opt, lambda value: value <= opt)
+
     def validate_gte(self, value, opt):
         return value >= opt
 
+    def many_gte(self, values, opt):
+        return _many(values, [opt], lambda a: a >= opt, lambda value: value >= opt)
+
 
 class EqualityValidationMixin(object):
 
     def validate_eq(self, value, opt):
         return value == opt
 
+    def many_eq(self, values, opt):
+        return _many(values, [opt], lambda a: a == opt, lambda value: value == opt)
+
     def validate_ne(self, value, opt):
         return value != opt
 
+    def many_ne(self, values, opt):
+        return _many(values, [opt], lambda a: a != opt, lambda value: value != opt)
+
 
 class RegexValidationMixin(object):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._regex_matchers = {}
+        self._regex_prechecks = {}
+        if 'regex' in self._options:
+            self._regex_matcher(self._options['regex'])
+
+    def __getstate__(self):
+        return dict(super().__getstate__(), _regex_matchers={})
+
+    def set_regex_precheck(self, precheck):
+        """Cheap necessary condition of the regex option of this datatype, checked before the regex."""
+        self._regex_prechecks = {self._options['regex']: precheck}
+        self._regex_matchers.pop(self._options['regex'], None)
+
     def validate_regex(self, value, opt):
-        return re.match(opt, value) is not None
+        return self._regex_matcher(opt)(value)
+
+    def compile_regex(self, opt):
+        return self._regex_matcher(opt)
+
+    def _regex_matcher(self, opt):
+        if opt not in self._regex_matchers:
+            match = re.compile(opt).match
+            precheck = self._regex_prechecks.get(opt)
+            if precheck is None:
+                self._regex_matchers[opt] = lambda value: match(value) is not None
+            else:
+                self._regex_matchers[opt] = lambda value: precheck(value) and match(value) is not None
+        return self._regex_matchers[opt]
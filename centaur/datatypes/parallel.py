@@ -0,0 +1,120 @@
+from concurrent.futures import ProcessPoolExecutor
+from .classes import ExtendedDataType, ListDatatype, _expected
+from .exceptions import ValidationError, ErrorItem
+
+
+class ParallelListValidator(object):
+    """Validates the items of large lists in chunks on a pool of processes.
+
+    Every worker receives the item datatype (and with it the whole context) once, when it starts.
+    Lists shorter than `min_size` are validated in this process. `guard` raises the error of the
+    first invalid item, with `collect_all` the ValidationError has the ErrorItems of all items.
+    """
+    def __init__(self, datatype, max_workers=None, chunk_size=10000, min_size=50000, collect_all=False):
+        self.datatype = datatype
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self.min_size = min_size
+        self.collect_all = collect_all
+        self._executor = None
+        self._version = None
+
+    def guard(self, value):
+        base_dt, options = _resolve(self.datatype)
+        if not isinstance(base_dt, ListDatatype) or 'items' not in options or \
+                not isinstance(value, list) or len(value) < self.min_size:
+            return self._guard_serial(value)
+        errors = []
+        for option, opt in options.items():  # in the order of serial validation
+            if option == 'items':
+                errors.extend(self._validate_items(opt, value))
+            elif not getattr(base_dt, 'validate_{}'.format(option))(value, opt):
+                errors.append(ValidationError(
+                    base_dt.get_exception_msg(option_name=option, option_value=opt, value=value),
+                    errors=[ErrorItem('', option, _expected(opt), value)]))
+            if errors and not self.collect_all:
+                raise errors[0]
+        if errors:
+            if not self.collect_all:
+                raise errors[0]
+            raise ValidationError(*errors[0].args, errors=[item for e in errors for item in e.errors])
+        return True
+
+    def fulfill(self, value):
+        try:
+            return self.guard(value)
+        except ValidationError:
+            return False
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _guard_serial(self, value):
+        try:
+            return self.datatype.guard(value)
+        except ValidationError as e:
+            if self.collect_all:
+                e.errors = self.datatype.validate(value, collect_all=True)
+            raise
+
+    def _validate_items(self, item_dt, value):
+        executor = self._executor_for(item_dt)
+        chunks = [executor.submit(_validate_chunk, start, value[start:start + self.chunk_size], self.collect_all)
+                  for start in range(0, len(value), self.chunk_size)]
+        errors = []
+        for future in chunks:
+            errors.extend(ValidationError(*args, errors=chunk_errors) for args, chunk_errors in future.result())
+            if errors and not self.collect_all:
+                for f in chunks:
+                    f.cancel()
+                break
+        return errors
+
+    def _executor_for(self, item_dt):
+        # workers keep the schema they started with, a changed context needs new workers
+        if self._executor is not None and self._version != self.datatype._ctx._version:
+            self.close()
+        if self._executor is None:
+            self._version = self.datatype._ctx._version
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, initializer=_init_worker, initargs=(item_dt,))
+        return self._executor
+
+
+def _resolve(datatype):
+    options = datatype.get_options()
+    if isinstance(datatype, ExtendedDataType):
+        datatype, _, options = datatype._resolve()
+        while isinstance(datatype, ExtendedDataType):
+            datatype = datatype._resolve()[0]
+    return datatype, options
+
+
+_worker_item_dt = None
+
+
+def _init_worker(item_dt):
+    global _worker_item_dt
+    _worker_item_dt = item_dt
+
+
+def _validate_chunk(start, items, collect_all):
+    """(args, ErrorItems) of the errors in items, only the first one unless collect_all."""
+    guard = _worker_item_dt.compile()
+    errors = []
+    for i, item in enumerate(items, start):
+        try:
+            guard(item)
+        except ValidationError as e:
+            if not collect_all:
+                return [(e.args, [])]
+            errors.append((e.args, _worker_item_dt.validate(item, collect_all=True, path='[{}]'.format(i))))
+    return errors
@@ -0,0 +1,135 @@
+import codecs
+import json
+import re
+from collections import namedtuple
+import yaml
+from .exceptions import ValidationError
+
+
+StreamItem = namedtuple('StreamItem', ['path', 'value', 'error'])
+
+_WS = re.compile(r'[ \t\n\r]*')
+
+
+def validate_stream(stream, datatype, format='ndjson', chunk_size=65536):
+    """Validates the records of a stream one by one, yields a StreamItem for each record.
+
+    Supported formats: 'ndjson' (one record per line), 'json' (an array of records)
+    and 'yaml' (a stream of documents). Only one record is held in memory at a time.
+    """
+    records = {'ndjson': _iter_ndjson, 'json': _iter_json_array, 'yaml': _iter_yaml}[format]
+    guard = datatype.compile()
+    for index, value, error in records(stream, chunk_size):
+        path = '[{}]'.format(index)
+        if error is None:
+            try:
+                guard(value)
+            except ValidationError as e:
+                error = e
+        yield StreamItem(path, value, error)
+
+
+def _iter_text(stream, chunk_size):
+    decoder = None
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        if isinstance(chunk, bytes):
+            decoder = decoder or codecs.getincrementaldecoder('utf-8')()
+            chunk = decoder.decode(chunk)
+        yield chunk
+
+
+def _iter_lines(stream, chunk_size):
+    pending = []
+    for chunk in _iter_text(stream, chunk_size):
+        if '\n' not in chunk:
+            pending.append(chunk)
+            continue
+        lines = chunk.split('\n')
+        yield ''.join(pending + lines[:1])
+        yield from lines[1:-1]
+        pending = [lines[-1]]
+    if pending:
+        yield ''.join(pending)
+
+
+def _iter_ndjson(stream, chunk_size):
+    index = 0
+    for line in _iter_lines(stream, chunk_size):
+        if not line.strip():
+            continue
+        try:
+            yield index, json.loads(line), None
+        except ValueError as e:
+            yield index, line, ValidationError("Invalid JSON record: {}".format(e))
+        index += 1
+
+
+def _iter_json_array(stream, chunk_size):
+    decode = json.JSONDecoder().raw_decode
+    text = _TextBuffer(stream, chunk_size)
+    text.expect('[')
+    if text.peek() == ']':
+        return
+    index = 0
+    while True:
+        yield index, text.decode(decode), None
+        index += 1
+        if text.expect(',', ']') == ']':
+            return
+
+
+def _iter_yaml(stream, chunk_size):
+    for index, value in enumerate(yaml.safe_load_all(stream)):
+        yield index, value, None
+
+
+class _TextBuffer(object):
+    def __init__(self, stream, chunk_size):
+        self._chunks = _iter_text(stream, chunk_size)
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+
+    def _read_more(self):
+        """Drops the consumed text and reads at least as much as is left in the buffer."""
+        self._buffer = self._buffer[self._pos:]
+        self._pos = 0
+        wanted, read = max(len(self._buffer), 1), 0
+        for chunk in self._chunks:
+            self._buffer += chunk
+            read += len(chunk)
+            if read >= wanted:
+                break
+        self._eof = read == 0
+        return not self._eof
+
+    def peek(self):
+        while True:
+            self._pos = _WS.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer) or not self._read_more():
+                return self._buffer[self._pos:self._pos + 1]
+
+    def expect(self, *chars):
+        c = self.peek()
+        if c == '' or c not in chars:
+            raise json.JSONDecodeError(
+                "Expecting {}".format(' or '.join(repr(c) for c in chars)), self._buffer, self._pos)
+        self._pos += 1
+        return c
+
+    def decode(self, raw_decode):
+        # a value is complete if something follows it, a number could go on in the next chunk
+        self.peek()
+        while True:
+            try:
+                value, end = raw_decode(self._buffer, self._pos)
+                if self._eof or _WS.match(self._buffer, end).end() < len(self._buffer):
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            self._read_more()
@@ -1,22 +1,69 @@
 import operator
 import logging
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from itertools import count
+from centaur.utils import IDGenerator
+from centaur.safe_import import safe_import
 
+np = safe_import('numpy', msg='Plz. install numpy for batch query evaluation')
 logger = logging.getLogger(__name__)
 
 
 class WQuery(object):
+    _cost = 10
+    _may_raise = True  # check may raise for some values, the optimizer keeps such queries in place
+
     def check(self, value):  # noqa
         return False
 
     def as_predicate(self):
         return self.check
 
+    def compile(self):
+        return _WQueryCompiler().compile(self)
+
+    def optimize(self, sample=None):
+        return self._optimize(sample)
+
+    def estimate_cost(self):
+        return self._cost
+
+    def filter_columns(self, columns):
+        columns = {k: np.asarray(v) for k, v in columns.items()}
+        size = len(next(iter(columns.values()))) if columns else 0
+        return self._mask(columns, np.ones(size, dtype=bool))
+
+    def _emit(self, c, target):
+        c.assign(target, '{}(value)'.format(c.const(self.check)))
+
+    def _mask(self, columns, rows):
+        """Mask of the rows matching the query, checked only where rows is True and False elsewhere.
+
+        Like the short circuit of check, rows already decided by other subqueries are left out.
+        """
+        keys = list(columns)
+        selected = np.flatnonzero(rows)
+        values = [columns[k][selected].tolist() for k in keys]
+        mask = np.zeros(len(rows), dtype=bool)
+        mask[selected] = np.fromiter(
+            (bool(self.check(dict(zip(keys, row)))) for row in zip(*values)), dtype=bool, count=len(selected))
+        return mask
+
+    def _optimize(self, sample):
+        return self
+
 
 class PrimitiveWQuery(WQuery):
     def __init__(self, selector, argument):
         self.selector = selector
         self.argument = argument
 
+    _inline_argument = True
+    _vectorizable = False
+    _may_raise = False  # TypeError is caught
+    _cost = 1
+
     def select(self, value):
         return value.get(self.selector)
 
@@ -27,6 +74,36 @@ class PrimitiveWQuery(WQuery):
             logger.warn(e)
             return False
 
+    def _emit(self, c, target):
+        with c.block('try:'):
+            c.assign(target, self._template.format(
+                value=c.select(self.selector),
+                argument=c.const(self.argument, inline=self._inline_argument)))
+        with c.block('except TypeError as e:'):
+            c.line('_logger.warning(e)')
+            c.assign(target, 'False')
+
+    def _mask(self, columns, rows):
+        size = len(rows)
+        column = columns[self.selector] if self.selector in columns else np.full(size, None, dtype=object)
+        try:
+            # only for columns of the same kind as the argument, where numpy does not raise for any row,
+            # so the whole column is compared at once instead of gathering the rows
+            mask = self._vectorized(column)
+        except TypeError:
+            mask = None
+        if isinstance(mask, np.ndarray) and mask.dtype == bool and mask.shape == (size, ):
+            return mask & rows
+        selected = np.flatnonzero(rows)
+        mask = np.zeros(size, dtype=bool)
+        mask[selected] = np.fromiter(
+            (bool(self.check({self.selector: v})) for v in column[selected].tolist()), dtype=bool, count=len(selected))
+        return mask
+
+    def _vectorized(self, column):
+        if self._vectorizable and _same_kind(column, (self.argument, )):
+            return self._operator(column, self.argument)
+
     def __repr__(self):
         return "('{}', '{}', {})".format(self._tag, self.selector, repr(self.argument))
 
@@ -40,10 +117,33 @@ class PrimitiveWQuery(WQuery):
             self.argument == other.argument])
 
 
+def _same_kind(column, values):
+    """True if numpy compares the values with the column like Python does: numbers with a numeric
+    column, strings with a str column. Anything else (lists, mixed values, object columns) is
+    broadcast or coerced by numpy, those are checked row by row."""
+    kind = column.dtype.kind
+    if kind in 'biuf':
+        return all(isinstance(v, (int, float, np.number)) and not isinstance(v, np.datetime64) and
+                   not (isinstance(v, int) and abs(v) >= 2 ** 63) for v in values)
+    elif kind == 'U':
+        return all(isinstance(v, str) for v in values)
+    return False
+
+
 class CompositeWQuery(WQuery):
     def __init__(self, *subqueries):
         self.subqueries = subqueries
 
+    @property
+    def _may_raise(self):
+        return any(s._may_raise for s in self.subqueries)
+
+    def estimate_cost(self):
+        return sum(s.estimate_cost() for s in self.subqueries)
+
+    def _optimize(self, sample):
+        return self.__class__(*[s._optimize(sample) for s in self.subqueries])
+
     def __repr__(self):
         def _space_indent(spaces, s):
             return '\n'. join([(' ' * spaces) + line for line in s.split('\n')])
@@ -63,9 +163,18 @@ class CompositeWQuery(WQuery):
 
 
 class WEmpty(WQuery):
+    _cost = 0
+    _may_raise = False
+
     def check(self, value):
         return True
 
+    def _emit(self, c, target):
+        c.assign(target, 'True')
+
+    def _mask(self, columns, rows):
+        return rows.copy()
+
     def __repr__(self):
         return 'None'
 
@@ -79,50 +188,103 @@ class WEmpty(WQuery):
 class WEq(PrimitiveWQuery):
     _operator = operator.eq
     _tag = 'eq'
+    _template = '{value} == {argument}'
+    _vectorizable = True
 
 
 class WNeq(PrimitiveWQuery):
     _operator = operator.ne
     _tag = 'neq'
+    _template = '{value} != {argument}'
+    _vectorizable = True
 
 
 class WLt(PrimitiveWQuery):
     _operator = operator.lt
     _tag = 'lt'
+    _template = '{value} < {argument}'
+    _vectorizable = True
 
 
 class WGt(PrimitiveWQuery):
     _operator = operator.gt
     _tag = 'gt'
+    _template = '{value} > {argument}'
+    _vectorizable = True
 
 
 class WLte(PrimitiveWQuery):
     _operator = operator.le
     _tag = 'lte'
+    _template = '{value} <= {argument}'
+    _vectorizable = True
 
 
 class WGte(PrimitiveWQuery):
     _operator = operator.ge
     _tag = 'gte'
+    _template = '{value} >= {argument}'
+    _vectorizable = True
 
 
 class WIn(PrimitiveWQuery):
     _tag = 'in'
 
+    @property
+    def _may_raise(self):
+        return not isinstance(self.argument, (list, tuple, set, frozenset))
+
     def check(self, value):
-        return self.select(value) in self.argument
+        try:
+            return self.select(value) in self.argument
+        except TypeError:
+            if isinstance(self.argument, (set, frozenset)):
+                return False  # unhashable values are never members of a set
+            raise
+
+    def estimate_cost(self):
+        return _membership_cost(self.argument)
+
+    def _emit(self, c, target):
+        _emit_membership(self, c, target)
+
+    def _vectorized(self, column):
+        if isinstance(self.argument, (list, tuple, set, frozenset)) and _same_kind(column, self.argument):
+            return np.isin(column, list(self.argument))
 
 
 class WNin(PrimitiveWQuery):
     _tag = 'nin'
 
+    @property
+    def _may_raise(self):
+        return not isinstance(self.argument, (list, tuple, set, frozenset))
+
     def check(self, value):
-        return self.select(value) not in self.argument
+        try:
+            return self.select(value) not in self.argument
+        except TypeError:
+            if isinstance(self.argument, (set, frozenset)):
+                return True
+            raise
+
+    def estimate_cost(self):
+        return _membership_cost(self.argument)
+
+    def _emit(self, c, target):
+        _emit_membership(self, c, target)
+        c.assign(target, 'not {}'.format(target))
+
+    def _vectorized(self, column):
+        if isinstance(self.argument, (list, tuple, set, frozenset)) and _same_kind(column, self.argument):
+            return np.isin(column, list(self.argument), invert=True)
 
 
 class WContains(PrimitiveWQuery):
     _operator = operator.contains
     _tag = 'contains'
+    _cost = 4
+    _template = '{argument} in {value}'
 
 
 class WNContains(WContains):  # FIXME: better solution for negation!
@@ -131,31 +293,74 @@ class WNContains(WContains):  # FIXME: better solution for negation!
     def check(self, value):
         return not super().check(value)
 
+    def _emit(self, c, target):
+        super()._emit(c, target)
+        c.assign(target, 'not {}'.format(target))
+
 
 class WStartswith(PrimitiveWQuery):
     _tag = 'startswith'
+    _cost = 2
+    _may_raise = True  # for values without startswith
 
     def check(self, value):
         return self.select(value).startswith(self.argument)
 
+    def _emit(self, c, target):
+        c.assign(target, '{}.startswith({})'.format(c.select(self.selector), c.const(self.argument)))
+
+    def _vectorized(self, column):
+        if column.dtype.kind in 'US':
+            return np.char.startswith(column, self.argument)
+
 
 class WEndswith(PrimitiveWQuery):
     _tag = 'endswith'
+    _cost = 2
+    _may_raise = True  # for values without endswith
 
     def check(self, value):
         return self.select(value).endswith(self.argument)
 
+    def _emit(self, c, target):
+        c.assign(target, '{}.endswith({})'.format(c.select(self.selector), c.const(self.argument)))
+
+    def _vectorized(self, column):
+        if column.dtype.kind in 'US':
+            return np.char.endswith(column, self.argument)
+
 
 class WIs(PrimitiveWQuery):
     _operator = operator.is_
     _tag = 'is'
+    _template = '{value} is {argument}'
+    _inline_argument = False
 
 
 class WAnd(CompositeWQuery):
     _tag = 'and'
 
     def check(self, value):
-        return all([s.check(value) for s in self.subqueries])
+        return all(s.check(value) for s in self.subqueries)
+
+    def _emit(self, c, target):
+        _emit_short_circuit(self, c, target, stop_on=False)
+
+    def _mask(self, columns, rows):
+        mask = rows.copy()
+        for s in self.subqueries:
+            if not mask.any():
+                break
+            mask &= s._mask(columns, mask)
+        return mask
+
+    def _optimize(self, sample):
+        subqueries = [s for s in _flatten_subqueries(self, sample) if not isinstance(s, WEmpty)]
+        if len(subqueries) == 0:
+            return WEmpty()
+        elif len(subqueries) == 1:
+            return subqueries[0]
+        return WAnd(*_order_subqueries(subqueries, sample, stop_on=False))
 
 
 class WNot(CompositeWQuery):
@@ -164,12 +369,201 @@ class WNot(CompositeWQuery):
     def check(self, value):
         return not self.subqueries[0].check(value)
 
+    def _emit(self, c, target):
+        self.subqueries[0]._emit(c, target)
+        c.assign(target, 'not {}'.format(target))
+
+    def _mask(self, columns, rows):
+        return rows & ~self.subqueries[0]._mask(columns, rows)
+
 
 class WOr(CompositeWQuery):
     _tag = 'or'
 
     def check(self, value):
-        return any([s.check(value) for s in self.subqueries])
+        return any(s.check(value) for s in self.subqueries)
+
+    def _emit(self, c, target):
+        _emit_short_circuit(self, c, target, stop_on=True)
+
+    def _mask(self, columns, rows):
+        mask = np.zeros(len(rows), dtype=bool)
+        undecided = rows.copy()
+        for s in self.subqueries:
+            if not undecided.any():
+                break
+            matched = s._mask(columns, undecided)
+            mask |= matched
+            undecided &= ~matched
+        return mask
+
+    def _optimize(self, sample):
+        subqueries = _flatten_subqueries(self, sample)
+        if any(isinstance(s, WEmpty) for s in subqueries):
+            return WEmpty()
+        subqueries = _merge_equalities(subqueries)
+        if len(subqueries) == 1:
+            return subqueries[0]
+        return WOr(*_order_subqueries(subqueries, sample, stop_on=True))
+
+
+def _membership_cost(argument):
+    if isinstance(argument, (set, frozenset)):
+        return PrimitiveWQuery._cost
+    try:
+        return max(PrimitiveWQuery._cost, len(argument) / 4)
+    except TypeError:
+        return WQuery._cost
+
+
+def _flatten_subqueries(wq, sample):
+    ret = []
+    for s in wq.subqueries:
+        s = s._optimize(sample)
+        ret.extend(s.subqueries if isinstance(s, wq.__class__) else [s])
+    return ret
+
+
+def _merge_equalities(subqueries):
+    """eq/in subqueries on the same selector are merged into one set lookup."""
+    def _members(s):
+        return [s.argument] if isinstance(s, WEq) else s.argument
+
+    def _merged_query(s):
+        if isinstance(s, WQuery):
+            return s
+        elif len(groups[s]) == 1:
+            return groups[s][0]
+        return WIn(s, frozenset().union(*[_members(q) for q in groups[s]]))
+
+    merged, groups = [], {}
+    for s in subqueries:
+        if isinstance(s, (WEq, WIn)) and _hashable_lookup(_members(s)) is not None:
+            if s.selector not in groups:
+                groups[s.selector] = []
+                merged.append(s.selector)
+            groups[s.selector].append(s)
+        else:
+            merged.append(s)
+    return [_merged_query(s) for s in merged]
+
+
+def _order_subqueries(subqueries, sample, stop_on):
+    """Cheap subqueries which most likely decide the result come first.
+
+    Subqueries which may raise keep their position, only the ones between them are reordered,
+    so the subqueries guarding them are still checked before."""
+    def _decides(s, value):
+        try:
+            return bool(s.check(value)) is stop_on
+        except (TypeError, AttributeError):
+            return False
+
+    def _decisiveness(s):
+        if not sample:
+            return 0.5
+        return max(sum(1 for value in sample if _decides(s, value)), 1) / len(sample)
+
+    def _ordered(run):
+        return sorted(run, key=lambda s: s.estimate_cost() / _decisiveness(s))
+
+    ordered, run = [], []
+    for s in subqueries:
+        if s._may_raise:
+            ordered.extend(_ordered(run) + [s])
+            run = []
+        else:
+            run.append(s)
+    return ordered + _ordered(run)
+
+
+def _emit_membership(wq, c, target):
+    value, argument = c.select(wq.selector), c.const(wq.argument)
+    lookup = _hashable_lookup(wq.argument)
+    if lookup is None:
+        c.assign(target, '{} in {}'.format(value, argument))
+    else:
+        # unhashable values can still be equal to an item of the original argument
+        with c.block('try:'):
+            c.assign(target, '{} in {}'.format(value, c.const(lookup)))
+        with c.block('except TypeError:'):
+            if isinstance(wq.argument, (set, frozenset)):
+                c.assign(target, 'False')
+            else:
+                c.assign(target, '{} in {}'.format(value, argument))
+
+
+def _hashable_lookup(argument):
+    if not isinstance(argument, (list, tuple, set, frozenset)):
+        return None
+    try:
+        return frozenset(argument)
+    except TypeError:
+        return None
+
+
+def _emit_short_circuit(wq, c, target, stop_on):
+    sub = c.var()
+    c.assign(target, repr(not stop_on))
+    for i, s in enumerate(wq.subqueries):
+        with c.block('if {}{}:'.format('not ' if stop_on else '', target) if i > 0 else None):
+            s._emit(c, sub)
+            with c.block('if {}{}:'.format('' if stop_on else 'not ', sub)):
+                c.assign(target, repr(stop_on))
+
+
+class _WQueryCompiler(object):
+    _literal_types = (str, int, bool, type(None))
+
+    def __init__(self):
+        self.namespace = {'_logger': logger}
+        self._lines = []
+        self._indent = 1
+        self._ids = IDGenerator()
+        self._uses_get = False
+
+    def var(self):
+        return self._ids.generate_id('_r')
+
+    def const(self, obj, inline=True):
+        if inline and type(obj) in self._literal_types:
+            return repr(obj)
+        name = self._ids.generate_id('_c')
+        self.namespace[name] = obj
+        return name
+
+    def select(self, selector):
+        self._uses_get = True
+        return '_get({})'.format(self.const(selector))
+
+    def line(self, s):
+        self._lines.append('    ' * self._indent + s)
+
+    def assign(self, target, expr):
+        self.line('{} = {}'.format(target, expr))
+
+    @contextmanager
+    def block(self, header):
+        if header is None:
+            yield
+            return
+        self.line(header)
+        self._indent += 1
+        yield
+        self._indent -= 1
+
+    def compile(self, wq):
+        result = self.var()
+        wq._emit(self, result)
+        source = '\n'.join(
+            ['def _compiled_wquery(value):'] +
+            (['    _get = value.get'] if self._uses_get else []) +
+            self._lines +
+            ['    return {}'.format(result)])
+        exec(compile(source, '<wquery>', 'exec'), self.namespace)
+        fn = self.namespace['_compiled_wquery']
+        fn.source = source
+        return fn
 
 
 _primitive_queries = {cls._tag: cls for cls in [
@@ -189,3 +583,358 @@ def parse_wt(wt):
     elif wt[0] in _composite_queries:
         return _composite_queries[wt[0]](*[parse_wt(swt) for swt in wt[1:]])
     raise TypeError("Invalid query definition {}".format(repr(wt)))
+
+
+def compile_wt(wt):
+    return parse_wt(wt).compile()
+
+
+def optimize_wt(wt, sample=None):
+    return parse_wt(wt).optimize(sample=sample)
+
+
+class QueryIndex(object):
+    """Finds the registered queries matching a value without checking each of them.
+
+    Every query is indexed by primitive predicates (anchors) of which at least one
+    holds whenever the query matches; only the candidates found through the anchors
+    are checked with the compiled query. Queries without anchors are always checked.
+    """
+    _anchor_costs = {'eq': 1, 'startswith': 2, 'endswith': 2, 'lt': 4, 'lte': 4, 'gt': 4, 'gte': 4}
+
+    def __init__(self):
+        self._predicates = {}
+        self._anchors = {}
+        self._order = {}
+        self._counter = count()
+        self._unindexed = set()
+        self._hashes = {}  # selector -> {argument: keys}
+        self._affixes = {}  # (tag, selector) -> {len(argument): {argument: keys}}
+        self._ranges = {}  # (tag, selector) -> (sorted arguments, keys)
+
+    def __len__(self):
+        return len(self._predicates)
+
+    def __contains__(self, key):
+        return key in self._predicates
+
+    def add(self, key, wq):
+        if not isinstance(wq, WQuery):
+            wq = parse_wt(wq)
+        if key in self._predicates:
+            self.remove(key)
+        self._predicates[key] = wq.compile()
+        self._order[key] = next(self._counter)
+        anchors = self._anchors_for(wq)
+        if anchors is None:
+            self._unindexed.add(key)
+        else:
+            self._anchors[key] = set(anchors)
+            for anchor in self._anchors[key]:
+                self._index(key, *anchor)
+        return self
+
+    def remove(self, key):
+        del self._predicates[key]
+        del self._order[key]
+        self._unindexed.discard(key)
+        for anchor in self._anchors.pop(key, ()):
+            self._unindex(key, *anchor)
+
+    def match(self, value):
+        candidates = set(self._unindexed)
+        for selector, postings in self._hashes.items():
+            v = value.get(selector)
+            try:
+                candidates.update(postings.get(v, ()))
+            except TypeError:  # unhashable value, may still equal an argument, e.g. a set and a frozenset
+                candidates.update(key for argument, keys in postings.items() if argument == v for key in keys)
+        for (tag, selector), by_length in self._affixes.items():
+            v = value.get(selector)
+            if isinstance(v, str):
+                for length, postings in by_length.items():
+                    candidates.update(postings.get(v[:length] if tag == 'startswith' else v[len(v) - length:], ()))
+        for (tag, selector), (arguments, keys) in self._ranges.items():
+            try:
+                candidates.update(keys[self._range_slice(tag, arguments, value.get(selector))])
+            except TypeError:  # not comparable with the arguments, can not match
+                pass
+        return [key for key in sorted(candidates, key=self._order.__getitem__) if self._predicates[key](value)]
+
+    @classmethod
+    def _anchors_for(cls, wq):
+        if isinstance(wq, WEq) and _hashable_lookup([wq.argument]) is not None:
+            return [('eq', wq.selector, wq.argument)]
+        elif isinstance(wq, WIn) and _hashable_lookup(wq.argument) is not None:
+            return [('eq', wq.selector, a) for a in _hashable_lookup(wq.argument)]
+        elif isinstance(wq, (WStartswith, WEndswith)) and isinstance(wq.argument, str):
+            return [(wq._tag, wq.selector, wq.argument)]
+        elif isinstance(wq, (WLt, WLte, WGt, WGte)) and isinstance(wq.argument, (int, float)) \
+                and wq.argument == wq.argument:  # nan would break the order of the range arguments
+            return [(wq._tag, wq.selector, wq.argument)]
+        elif isinstance(wq, WAnd):
+            options = [a for a in map(cls._anchors_for, wq.subqueries) if a is not None]
+            return min(options, key=cls._anchors_cost) if options else None
+        elif isinstance(wq, WOr):
+            options = list(map(cls._anchors_for, wq.subqueries))
+            return None if None in options else [a for anchors in options for a in anchors]
+        return None
+
+    @classmethod
+    def _anchors_cost(cls, anchors):
+        return sum(cls._anchor_costs[tag] for tag, _, _ in anchors)
+
+    @staticmethod
+    def _range_slice(tag, arguments, v):
+        if tag == 'lt':
+            return slice(bisect_right(arguments, v), None)
+        elif tag == 'lte':
+            return slice(bisect_left(arguments, v), None)
+        elif tag == 'gt':
+            return slice(None, bisect_left(arguments, v))
+        return slice(None, bisect_right(arguments, v))
+
+    def _index(self, key, tag, selector, argument):
+        if tag == 'eq':
+            self._hashes.setdefault(selector, {}).setdefault(argument, set()).add(key)
+        elif tag in ('startswith', 'endswith'):
+            self._affixes.setdefault((tag, selector), {}).setdefault(
+                len(argument), {}).setdefault(argument, set()).add(key)
+        else:
+            arguments, keys = self._ranges.setdefault((tag, selector), ([], []))
+            i = bisect_right(arguments, argument)
+            arguments.insert(i, argument)
+            keys.insert(i, key)
+
+    def _unindex(self, key, tag, selector, argument):
+        def _discard(d, k, item):
+            d[k].discard(item)
+            if not d[k]:
+                del d[k]
+
+        if tag == 'eq':
+            _discard(self._hashes[selector], argument, key)
+            if not self._hashes[selector]:
+                del self._hashes[selector]
+        elif tag in ('startswith', 'endswith'):
+            by_length = self._affixes[(tag, selector)]
+            _discard(by_length[len(argument)], argument, key)
+            if not by_length[len(argument)]:
+                del by_length[len(argument)]
+            if not by_length:
+                del self._affixes[(tag, selector)]
+        else:
+            arguments, keys = self._ranges[(tag, selector)]
+            i = keys.index(key, bisect_left(arguments, argument))
+            del arguments[i]
+            del keys[i]
+            if not arguments:
+                del self._ranges[(tag, selector)]
+
+
+class IndexedCollection(object):
+    """In-memory collection of dicts answering queries through secondary indexes.
+
+    Hash indexes serve eq/in, sorted indexes serve lt/gt/lte/gte, eq and startswith
+    (as a range scan over the sorted strings). The postings of the indexed leaves
+    are intersected/unioned and the candidates are checked with the whole query,
+    so leaves without an index act as a residual filter.
+    """
+
+    def __init__(self, items=(), hash_indexes=(), sorted_indexes=()):
+        self._items = {}
+        # item_id -> {selector: value} as indexed, items may be updated in place
+        self._indexed_values = {}
+        self._counter = count()
+        self._hash_indexes = {}
+        self._sorted_indexes = {}
+        for item in items:
+            self.insert(item)
+        # the indexes are built in bulk over the items
+        for selector in hash_indexes:
+            self.create_index(selector, 'hash')
+        for selector in sorted_indexes:
+            self.create_index(selector, 'sorted')
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items.values())
+
+    def get(self, item_id):
+        return self._items[item_id]
+
+    def create_index(self, selector, kind='hash'):
+        index = _HashIndex() if kind == 'hash' else _SortedIndex()
+        for item_id, item in self._items.items():
+            self._indexed_values[item_id][selector] = item.get(selector)
+        index.add_many((indexed[selector], item_id) for item_id, indexed in self._indexed_values.items())
+        (self._hash_indexes if kind == 'hash' else self._sorted_indexes)[selector] = index
+
+    def insert(self, item):
+        item_id = next(self._counter)
+        self._items[item_id] = item
+        self._indexed_values[item_id] = indexed = {}
+        for selector, index in self._indexes():
+            indexed[selector] = item.get(selector)
+            index.add(indexed[selector], item_id)
+        return item_id
+
+    def remove(self, item_id):
+        item = self._items.pop(item_id)
+        indexed = self._indexed_values.pop(item_id)
+        for selector, index in self._indexes():
+            index.remove(indexed[selector], item_id)
+        return item
+
+    def update(self, item_id, item):
+        """Replaces the item, which may also be the same dict modified in place."""
+        self._items[item_id] = item
+        indexed = self._indexed_values[item_id]
+        for selector, index in self._indexes():
+            if indexed[selector] is not item.get(selector):
+                index.remove(indexed[selector], item_id)
+                indexed[selector] = item.get(selector)
+                index.add(indexed[selector], item_id)
+
+    def filter(self, wq):
+        if not isinstance(wq, WQuery):
+            wq = parse_wt(wq)
+        predicate = wq.compile()
+        candidates = self._candidates(wq)
+        ids = self._items if candidates is None else sorted(candidates)
+        return [self._items[i] for i in ids if predicate(self._items[i])]
+
+    def _indexes(self):
+        yield from self._hash_indexes.items()
+        yield from self._sorted_indexes.items()
+
+    def _candidates(self, wq):
+        """Superset of the ids matching wq, or None if the indexes can not tell."""
+        if isinstance(wq, (WEq, WIn)) and wq.selector in self._hash_indexes:
+            return self._hash_indexes[wq.selector].lookup(
+                [wq.argument] if isinstance(wq, WEq) else wq.argument)
+        elif isinstance(wq, (WEq, WLt, WLte, WGt, WGte, WStartswith)) and wq.selector in self._sorted_indexes:
+            return self._sorted_indexes[wq.selector].lookup(wq._tag, wq.argument)
+        elif isinstance(wq, WAnd):
+            postings = [p for p in map(self._candidates, wq.subqueries) if p is not None]
+            return set.intersection(*sorted(postings, key=len)) if postings else None
+        elif isinstance(wq, WOr):
+            postings = list(map(self._candidates, wq.subqueries))
+            return None if None in postings else set().union(*postings)
+        return None
+
+
+class _HashIndex(object):
+    def __init__(self):
+        self._postings = {}
+        self._unhashable = set()
+
+    def add(self, value, item_id):
+        try:
+            self._postings.setdefault(value, set()).add(item_id)
+        except TypeError:
+            self._unhashable.add(item_id)
+
+    def add_many(self, pairs):
+        for value, item_id in pairs:
+            self.add(value, item_id)
+
+    def remove(self, value, item_id):
+        try:
+            self._postings[value].discard(item_id)
+            if not self._postings[value]:
+                del self._postings[value]
+        except TypeError:
+            self._unhashable.discard(item_id)
+
+    def lookup(self, arguments):
+        if _hashable_lookup(arguments) is None:
+            return None
+        return set(self._unhashable).union(*[self._postings.get(a, ()) for a in arguments])
+
+
+class _SortedIndex(object):
+    """Numbers and strings are kept in sorted buckets, anything else is unordered.
+
+    A bucket is the sorted list of the distinct values and the ids of the items per value.
+    """
+
+    def __init__(self):
+        self._buckets = {int: ([], {}), str: ([], {})}
+        self._unordered = set()
+
+    @staticmethod
+    def _bucket_type(value):
+        if isinstance(value, str):
+            return str
+        elif isinstance(value, (int, float)) and value == value:  # nan is unordered
+            return int
+        return None
+
+    def add(self, value, item_id):
+        bucket_type = self._bucket_type(value)
+        if bucket_type is None:
+            self._unordered.add(item_id)
+            return
+        values, ids = self._buckets[bucket_type]
+        if value not in ids:
+            values.insert(bisect_left(values, value), value)
+            ids[value] = set()
+        ids[value].add(item_id)
+
+    def add_many(self, pairs):
+        """Adds (value, item id) pairs, sorting the new values once."""
+        new_values = {int: [], str: []}
+        for value, item_id in pairs:
+            bucket_type = self._bucket_type(value)
+            if bucket_type is None:
+                self._unordered.add(item_id)
+                continue
+            ids = self._buckets[bucket_type][1]
+            if value not in ids:
+                new_values[bucket_type].append(value)
+                ids[value] = set()
+            ids[value].add(item_id)
+        for bucket_type, added in new_values.items():
+            if added:
+                values = self._buckets[bucket_type][0]
+                values[:] = sorted(values + added)
+
+    def remove(self, value, item_id):
+        bucket_type = self._bucket_type(value)
+        if bucket_type is None:
+            self._unordered.discard(item_id)
+            return
+        values, ids = self._buckets[bucket_type]
+        ids[value].discard(item_id)
+        if not ids[value]:
+            del ids[value]
+            del values[bisect_left(values, value)]
+
+    def lookup(self, tag, argument):
+        bucket_type = self._bucket_type(argument)
+        if bucket_type is None:
+            return None
+        values, ids = self._buckets[bucket_type]
+        if tag == 'startswith':
+            bounds = self._prefix_range(values, argument)
+        elif tag == 'eq':
+            bounds = bisect_left(values, argument), bisect_right(values, argument)
+        elif tag == 'lt':
+            bounds = None, bisect_left(values, argument)
+        elif tag == 'lte':
+            bounds = None, bisect_right(values, argument)
+        elif tag == 'gt':
+            bounds = bisect_right(values, argument), None
+        else:
+            bounds = bisect_left(values, argument), None
+        candidates = set() if tag == 'startswith' else set(self._unordered)
+        return candidates.union(*[ids[value] for value in values[slice(*bounds)]])
+
+    @staticmethod
+    def _prefix_range(values, prefix):
+        if prefix == '' or ord(prefix[-1]) == 0x10ffff:
+            return bisect_left(values, prefix), None
+        return bisect_left(values, prefix), bisect_left(values, prefix[:-1] + chr(ord(prefix[-1]) + 1))
@@ -42,7 +42,7 @@ class Switch(object):
         self.expire_date = expire_date
         self.created_at = created_at
         self.conditions = conditions
-        self._predicate = parse_wt(self.conditions).as_predicate() \
+        self._predicate = parse_wt(self.conditions).optimize().compile() \
             if conditions is not None else lambda value: False
 
     def is_enabled(self, *args, **kwargs):
@@ -1,3 +1,4 @@
+import weakref
 from functools import partial, update_wrapper, WRAPPER_ASSIGNMENTS, WRAPPER_UPDATES
 from inspect import signature
 from copy import deepcopy
@@ -22,8 +23,28 @@ def call_in_ctx(ctx_dict, fn):
 
 
 def select_params_for_fn(ctx_dict, fn):
-    sign = signature(fn)
-    return {k: v for k, v in ctx_dict.items() if k in sign.parameters}
+    return {k: ctx_dict[k] for k in param_names(fn) if k in ctx_dict}
+
+
+# bound methods are created on every attribute access, their plans are kept per function
+_param_names = weakref.WeakKeyDictionary()
+_bound_param_names = weakref.WeakKeyDictionary()
+
+
+def param_names(fn):
+    "Names of the parameters of fn, memoized per function."
+    func = getattr(fn, '__func__', None)
+    cache, key = (_bound_param_names, func) if func is not None else (_param_names, fn)
+    try:
+        return cache[key]
+    except (KeyError, TypeError):  # TypeError: can not be weakly referenced
+        pass
+    names = tuple(signature(fn).parameters)
+    try:
+        cache[key] = names
+    except TypeError:
+        pass
+    return names
 
 
 def without_items(dict_, keys):
@@ -38,13 +59,27 @@ def select_items(dict_, keys):
     return [dict_[k] for k in keys]
 
 
-def deep_merge(d1, d2):
-    ret = deepcopy(d1)
-    for k, v in d2.items():
-        if k in ret and isinstance(ret[k], dict):
-            ret[k] = deep_merge(ret[k], v)
+def deep_merge(d1, d2, _memo=None):
+    _memo = {} if _memo is None else _memo
+    ret = {}
+    for k, v in d1.items():
+        if k in d2 and isinstance(v, dict):
+            ret[k] = deep_merge(v, d2[k], _memo)
+        elif k in d2:
+            ret[k] = deepcopy(d2[k], _memo)
         else:
-            ret[k] = deepcopy(v)
+            ret[k] = deepcopy(v, _memo)
+    for k, v in d2.items():
+        if k not in d1:
+            ret[k] = deepcopy(v, _memo)
+    return ret
+
+
+def deep_merge_shared(d1, d2):
+    "deep_merge without copying, the result shares unchanged subtrees with d1 and d2."
+    ret = dict(d1)
+    for k, v in d2.items():
+        ret[k] = deep_merge_shared(ret[k], v) if k in ret and isinstance(ret[k], dict) else v
     return ret
 
 
@@ -63,21 +98,32 @@ def create_ids(prefix, counter=0):
 class IDGenerator(object):
     def __init__(self, create_fn=create_ids):
         self.generators = {}
+        self.counters = {}
         self.create_fn = create_fn
 
     def generate_id(self, prefix):
         if prefix not in self.generators:
             self.generators[prefix] = self.create_fn(prefix)
+        self.counters[prefix] = self.counters.get(prefix, 0) + 1
         return self.generators[prefix]()
 
+    def __getstate__(self):
+        # the generators are closures, they continue from the counters after unpickling
+        return {'counters': self.counters, 'create_fn': self.create_fn}
+
+    def __setstate__(self, state):
+        self.__init__(state['create_fn'])
+        self.counters = dict(state['counters'])
+        self.generators = {prefix: self.create_fn(prefix, counter=n) for prefix, n in self.counters.items()}
+
 
 def fill_defaults(dict_, defaults, keep_nones=False):
     def _iter_keys_once(dicts):
-        _yielded = []
+        _yielded = set()
         for d in dicts:
             for k in d.keys():
                 if k not in _yielded:
-                    _yielded.append(k)
+                    _yielded.add(k)
                     yield k
 
     def _test_key_in_dict_and_not_none(dict_, key):
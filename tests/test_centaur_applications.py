@@ -1,4 +1,5 @@
 import pytest
+from unittest.mock import patch
 from centaur.applications import Application, Adapter
 
 
@@ -63,3 +64,110 @@ def test_application_run_in_executor():
         return a + b
     app = Application()
     assert app.event_loop.run_until_complete(app.run_in_executor(blocking_function, a=10, b=10)) == 20
+
+
+def test_application_dispatch_table(sample_application):
+    app = sample_application
+    sample_fn = app.resolve('sample.sample_fn')
+    assert app.event_loop.run_until_complete(sample_fn(p='x')) == 'x'
+    assert app.resolve('sample.sample_fn') is sample_fn
+    with pytest.raises(AttributeError):
+        app.resolve('sample.unknown')
+    with pytest.raises(KeyError):
+        app.resolve('unknown.sample_fn')
+
+    class OtherAdapter(Adapter):
+        async def sample_fn(self, p):
+            return p * 2
+
+    app.adapters['sample'] = OtherAdapter(app)
+    app.adapters['other'] = OtherAdapter(app)
+    assert app.event_loop.run_until_complete(app.f_('sample.sample_fn', p='x')) == 'xx'
+    assert app.event_loop.run_until_complete(app.f_('other.sample_fn', p='y')) == 'yy'
+    assert app.resolve('other.sample_fn') is app.resolve('other.sample_fn')
+    app.adapters = {}
+    with pytest.raises(KeyError):
+        app.resolve('sample.sample_fn')
+
+
+def test_application_dispatch_table_sees_patched_methods(sample_application):
+    app = sample_application
+    adapter = app.adapters['sample']
+    assert app.event_loop.run_until_complete(app.f_('sample.sample_fn', p='x')) == 'x'
+
+    async def _patched_fn(p):
+        return 'patched'
+
+    adapter.sample_fn = _patched_fn
+    assert app.event_loop.run_until_complete(app.f_('sample.sample_fn', p='x')) == 'patched'
+    del adapter.sample_fn
+
+    async def _patched_method(self, p):
+        return 'class patched'
+
+    with patch.object(SampleAdapter, 'sample_fn', _patched_method):
+        assert app.event_loop.run_until_complete(app.f_('sample.sample_fn', p='x')) == 'class patched'
+    assert app.event_loop.run_until_complete(app.f_('sample.sample_fn', p='x')) == 'x'
+
+
+def test_application_dispatch_table_has_coroutine_methods_only():
+    class HelperAdapter(Adapter):
+        def create_connection(self):
+            return 'connection'
+
+        async def get(self):
+            return self.create_connection()
+
+    app = Application(adapters={'helper': HelperAdapter})
+    assert set(app._dispatch) == {'helper.get'}
+    assert app.event_loop.run_until_complete(app.f_('helper.get')) == 'connection'
+
+
+def test_application_executor_pools():
+    import asyncio
+    import operator
+    import threading
+    import time
+    from centaur.applications import PoolFullError
+
+    release = threading.Event()
+
+    def blocking_function(a):
+        release.wait(5)
+        return a
+
+    app = Application(config={'executors': {
+        'default': {'max_workers': 2},
+        'strict': {'max_workers': 1, 'max_queue': 1, 'on_full': 'reject'},
+        'bounded': {'max_workers': 1, 'max_queue': 1},
+        'processes': {'max_workers': 1, 'kind': 'process'},
+    }})
+
+    async def _strict_calls():
+        calls = [asyncio.ensure_future(app.run_in_executor(blocking_function, i, _pool='strict')) for i in range(3)]
+        await asyncio.sleep(0)  # every call is submitted or rejected before its first suspension
+        submitted = time.monotonic()
+        assert app.executors['strict'].metrics()['active'] == 1
+        assert app.executors['strict'].metrics()['queued'] == 1
+        released = time.monotonic()
+        release.set()
+        return await asyncio.gather(*calls, return_exceptions=True), released - submitted
+
+    results, held = app.event_loop.run_until_complete(_strict_calls())
+    assert results[:2] == [0, 1] and isinstance(results[2], PoolFullError)
+    metrics = app.executors['strict'].metrics()
+    assert (metrics['completed'], metrics['rejected'], metrics['active'], metrics['queued']) == (2, 1, 0, 0)
+    assert metrics['queue_wait_max'] >= held  # the queued call waited at least while the worker was held
+
+    async def _bounded_calls():
+        calls = [asyncio.ensure_future(app.run_in_executor(blocking_function, i, _pool='bounded')) for i in range(5)]
+        await asyncio.sleep(0)
+        assert app.executors['bounded'].metrics()['queued'] == 1  # the other calls wait for a free slot
+        return await asyncio.gather(*calls)
+
+    assert app.event_loop.run_until_complete(_bounded_calls()) == list(range(5))
+    assert app.executors['bounded'].metrics()['rejected'] == 0
+    assert app.event_loop.run_until_complete(app.run_in_executor(blocking_function, a=1)) == 1
+    assert app.executors['default'].completed == 1
+    assert app.event_loop.run_until_complete(app.run_in_executor(operator.add, 1, 2, _pool='processes')) == 3
+    app.shutdown_executors()
@@ -0,0 +1,565 @@
+import asyncio
+import json
+import pytest
+from centaur.applications import Adapter, Application
+from centaur.contrib import NimoyAdapter, PooledNimoyAdapter
+from centaur.contrib.batching import BatchLoader
+from centaur.contrib.caching import AsyncCache
+from centaur.contrib.pool import ConnectionPool
+from centaur.datatypes import ItemNotFoundError, ValidationError
+
+
+class FakeDatabase(object):
+    """In-process stand-in for nimoy's DatabaseConnection with coroutine methods."""
+    instances = []
+    page_calls = []
+
+    def __init__(self, tables):
+        self.tables = tables
+        self.closed = False
+        self.in_use = False
+        FakeDatabase.instances.append(self)
+
+    async def get_item(self, schema_name, _id):
+        assert not self.in_use
+        self.in_use = True
+        await asyncio.sleep(0.001)
+        self.in_use = False
+        return self.tables.get(schema_name, {}).get(_id)
+
+    async def put_item(self, schema_name, _data):
+        self.tables.setdefault(schema_name, {})[_data['_id']] = _data
+        return _data
+
+    async def query(self, schema_name, _w, limit):
+        return [item for item in self.tables.get(schema_name, {}).values() if _w(item)][:limit]
+
+    async def query_page(self, schema_name, _w, page_size, cursor):
+        FakeDatabase.page_calls.append(cursor)
+        await asyncio.sleep(0)
+        return _page(self.tables.get(schema_name, {}), _w, page_size, cursor)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeBlockingDatabase(object):
+    def __init__(self, tables):
+        self.tables = tables
+        self.calls = []
+
+    def get_item(self, schema_name, _id):
+        self.calls.append(('get_item', _id))
+        if _id not in self.tables.get(schema_name, {}):
+            raise ItemNotFoundError(_id)
+        return self.tables[schema_name][_id]
+
+    def put_item(self, schema_name, _data):
+        self.calls.append(('put_item', _data['_id']))
+        self.tables.setdefault(schema_name, {})[_data['_id']] = _data
+        return _data
+
+    def delete_item(self, schema_name, _id):
+        self.calls.append(('delete_item', _id))
+        return self.tables[schema_name].pop(_id)
+
+    def query_page(self, schema_name, _w, page_size, cursor):
+        self.calls.append(('query_page', cursor))
+        return _page(self.tables.get(schema_name, {}), _w, page_size, cursor)
+
+    def uuid(self):
+        return 'uuid'
+
+
+def _page(table, _w, page_size, cursor):
+    """Paging by offset in the matching items, ordered by _id."""
+    items = [item for _id, item in sorted(table.items()) if _w(item)]
+    start = cursor or 0
+    end = start + page_size
+    return items[start:end], (end if end < len(items) else None)
+
+
+def _app(adapter_cls, db_cls, **config):
+    tables = {'book': {i: {'_id': i} for i in range(10)}}
+
+    class _Adapter(adapter_cls):
+        def create_connection(self):
+            return db_cls(tables)
+
+    return Application(config=config, adapters={'nimoy': _Adapter})
+
+
+def test_nimoy_adapters():
+    for adapter_cls in [NimoyAdapter, PooledNimoyAdapter]:
+        app = _app(adapter_cls, FakeBlockingDatabase)
+        assert app.event_loop.run_until_complete(app.f_('nimoy.get_item', schema_name='book', _id=1)) == {'_id': 1}
+        assert app.event_loop.run_until_complete(app.f_('nimoy.uuid')) == 'uuid'
+
+
+def test_nimoy_adapters_reject_process_pools():
+    for adapter_cls in [NimoyAdapter, PooledNimoyAdapter]:
+        with pytest.raises(ValueError):
+            _app(adapter_cls, FakeBlockingDatabase, executors={'slow': {'kind': 'process'}}, nimoy_pools={'scan': 'slow'})
+        with pytest.raises(ValueError):
+            _app(adapter_cls, FakeBlockingDatabase, executors={'default': {'kind': 'process'}})
+    app = _app(NimoyAdapter, FakeBlockingDatabase, executors={'other': {'kind': 'process'}})
+    assert app.event_loop.run_until_complete(app.f_('nimoy.uuid')) == 'uuid'
+
+
+def test_nimoy_adapters_reject_unknown_pools():
+    for adapter_cls in [NimoyAdapter, PooledNimoyAdapter]:
+        with pytest.raises(ValueError) as e:
+            _app(adapter_cls, FakeBlockingDatabase, executors={'slow': {}}, nimoy_pools={'scan': 'slwo'})
+        assert 'slwo' in str(e.value)
+    app = _app(NimoyAdapter, FakeBlockingDatabase, executors={'slow': {}}, nimoy_pools={'uuid': 'slow'})
+    assert app.event_loop.run_until_complete(app.f_('nimoy.uuid')) == 'uuid'
+    assert app.executors['slow'].completed == 1
+
+
+def test_pooled_nimoy_adapter():
+    FakeDatabase.instances = []
+    app = _app(PooledNimoyAdapter, FakeDatabase, nimoy_pool={'size': 3})
+
+    async def _calls():
+        items = await asyncio.gather(*[app.f_('nimoy.get_item', schema_name='book', _id=i % 10) for i in range(50)])
+        await app.f_('nimoy.put_item', schema_name='book', _data={'_id': 10})
+        return items, await app.f_('nimoy.query', schema_name='book', _w=lambda item: item['_id'] > 5, limit=3)
+
+    items, queried = app.event_loop.run_until_complete(_calls())
+    assert items == [{'_id': i % 10} for i in range(50)]
+    assert queried == [{'_id': 6}, {'_id': 7}, {'_id': 8}]
+    pool = app.adapters['nimoy'].connection_pool
+    assert len(FakeDatabase.instances) == pool.created == 3
+    assert pool.in_use == 0
+
+
+def test_connection_pool_health_check_and_eviction():
+    now = [0]
+    created = []
+
+    def _create():
+        created.append(FakeDatabase({}))
+        return created[-1]
+
+    pool = ConnectionPool(_create, size=2, max_idle=10, check=lambda conn: not conn.closed, timer=lambda: now[0])
+    loop = asyncio.new_event_loop()
+
+    async def _use():
+        async with pool.connection() as conn:
+            return conn
+
+    conn = loop.run_until_complete(_use())
+    assert loop.run_until_complete(_use()) is conn
+    conn.closed = True
+    assert loop.run_until_complete(_use()) is not conn
+    assert len(created) == 2
+    now[0] = 20
+    assert loop.run_until_complete(_use()) is created[2]
+    assert pool.evicted == 1 and created[1].closed
+
+    async def _failing():
+        async with pool.connection():
+            raise ConnectionError()
+
+    with pytest.raises(ConnectionError):
+        loop.run_until_complete(_failing())
+    assert created[2].closed and pool.in_use == 0
+    loop.run_until_complete(pool.close())
+    loop.close()
+
+
+def test_connection_pool_failing_or_cancelled_check_frees_the_slot():
+    created = []
+    checking = asyncio.Event()
+
+    def _create():
+        created.append(FakeDatabase({}))
+        return created[-1]
+
+    async def _check(conn):
+        if conn is created[0]:
+            raise ConnectionError()
+        checking.set()
+        await asyncio.Event().wait()  # never healthy, cancelled below
+
+    pool = ConnectionPool(_create, size=1, check=_check)
+    loop = asyncio.new_event_loop()
+
+    async def _use():
+        async with pool.connection() as conn:
+            return conn
+
+    async def _cancelled_while_checking():
+        task = asyncio.ensure_future(pool.acquire())
+        await checking.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    assert loop.run_until_complete(_use()) is created[0]
+    assert loop.run_until_complete(_use()) is created[1] and created[0].closed
+    assert pool.in_use == 0
+    loop.run_until_complete(_cancelled_while_checking())
+    assert created[1].closed and pool.in_use == 0 and pool._n_connections == 0
+    pool.check = None
+    assert loop.run_until_complete(asyncio.wait_for(_use(), 1)) is created[2]
+    loop.close()
+
+
+def test_batch_loader():
+    batches = []
+
+    async def _batch_fn(keys):
+        batches.append(keys)
+        await asyncio.sleep(0)
+        return [ValueError(key) if key < 0 else key * 2 for key in keys]
+
+    loader = BatchLoader(_batch_fn, max_batch_size=4, window=0.01)
+
+    async def _loads():
+        first = await asyncio.gather(*[loader.load(key) for key in [1, 2, 1, 3]], return_exceptions=True)
+        second = await asyncio.gather(*[loader.load(key) for key in [1, 2, 3, 4, 5, -1]], return_exceptions=True)
+        return first, second
+
+    loop = asyncio.new_event_loop()
+    first, second = loop.run_until_complete(_loads())
+    assert first == [2, 4, 2, 6]
+    assert second[:5] == [2, 4, 6, 8, 10] and isinstance(second[5], ValueError)
+    assert batches == [[1, 2, 3], [1, 2, 3, 4], [5, -1]]
+
+    async def _failing_batch_fn(keys):
+        raise ConnectionError()
+
+    loader = BatchLoader(_failing_batch_fn)
+    with pytest.raises(ConnectionError):
+        loop.run_until_complete(loader.load_many(['a', 'b']))
+    loop.close()
+
+
+def test_batch_loader_cancelled_batches_release_their_keys():
+    started = asyncio.Event()
+    blocked = [True]
+
+    async def _batch_fn(keys):
+        if blocked[0]:
+            started.set()
+            await asyncio.Event().wait()
+        return keys
+
+    loader = BatchLoader(_batch_fn, window=0)
+
+    async def _cancelled():
+        loads = asyncio.gather(loader.load('a'), loader.load('b'), return_exceptions=True)
+        await started.wait()
+        assert len(loader._tasks) == 1
+        loader.close()
+        return await loads
+
+    loop = asyncio.new_event_loop()
+    results = loop.run_until_complete(_cancelled())
+    assert all(isinstance(r, asyncio.CancelledError) for r in results)
+    assert not loader._in_flight and not loader._tasks
+    blocked[0] = False
+    assert loop.run_until_complete(asyncio.wait_for(loader.load_many(['a', 'b']), 1)) == ['a', 'b']
+    loop.close()
+
+
+def test_nimoy_adapter_coalesces_get_item():
+    for adapter_cls in [NimoyAdapter, PooledNimoyAdapter]:
+        app = _app(adapter_cls, FakeBlockingDatabase, nimoy_batching={'max_batch_size': 5, 'window': 0.01})
+        adapter = app.adapters['nimoy']
+        hops = []
+        run_in_executor = app.run_in_executor
+
+        async def _counting_run_in_executor(fn, *args, **kwargs):
+            hops.append(fn)
+            return await run_in_executor(fn, *args, **kwargs)
+
+        app.run_in_executor = _counting_run_in_executor
+
+        async def _gets():
+            return await asyncio.gather(
+                *[app.f_('nimoy.get_item', schema_name='book', _id=i % 7) for i in range(12)], return_exceptions=True)
+
+        items = app.event_loop.run_until_complete(_gets())
+        assert items[:7] == [{'_id': i} for i in range(7)] and items[7:] == items[:5]
+        assert len(hops) == 2
+        assert isinstance(app.event_loop.run_until_complete(_missing(app)), ItemNotFoundError)
+
+        put = app.event_loop.run_until_complete(
+            app.f_('nimoy.put_items', schema_name='book', _items=[{'_id': i} for i in range(20, 32)]))
+        assert put == [{'_id': i} for i in range(20, 32)]
+        assert len(hops) == 2 + 1 + 3
+
+
+def test_async_cache():
+    now = [0]
+    loads = []
+
+    async def _load(key):
+        loads.append(key)
+        await asyncio.sleep(0)
+        if key < 0:
+            raise ValueError(key)
+        return [key] * key
+
+    cache = AsyncCache(max_entries=3, ttl=10, timer=lambda: now[0])
+    loop = asyncio.new_event_loop()
+
+    async def _gets(keys):
+        return await asyncio.gather(
+            *[cache.get_or_load(key, lambda key=key: _load(key)) for key in keys], return_exceptions=True)
+
+    def _get(*keys):
+        return loop.run_until_complete(_gets(keys))
+
+    assert _get(1, 2, 1, 2, 1) == [[1], [2, 2], [1], [2, 2], [1]]
+    assert loads == [1, 2] and (cache.hits, cache.misses) == (0, 5)
+    assert _get(1, 2) == [[1], [2, 2]] and cache.hits == 2
+    assert isinstance(_get(-1)[0], ValueError) and -1 not in cache._entries
+    _get(3, 4)
+    assert sorted(cache._entries) == [2, 3, 4] and cache.evictions == 1
+    now[0] = 15
+    assert _get(2) == [[2, 2]] and cache.evictions == 2 and loads[-1] == 2
+
+    cache = AsyncCache(max_bytes=300, ttl=None)
+    _get(1, 5, 2)
+    assert cache.size <= 300 and cache.evictions >= 1 and 1 not in cache._entries
+
+    async def _invalidated_while_loading():
+        get = asyncio.ensure_future(cache.get_or_load(7, lambda: _load(7)))
+        await asyncio.sleep(0)
+        cache.invalidate(7)
+        return await get
+
+    assert loop.run_until_complete(_invalidated_while_loading()) == [7] * 7
+    assert 7 not in cache._entries
+    loop.close()
+
+
+def test_nimoy_adapter_cache():
+    for adapter_cls in [NimoyAdapter, PooledNimoyAdapter]:
+        app = _app(adapter_cls, FakeBlockingDatabase, nimoy_cache={'max_entries': 5, 'ttl': 60})
+        adapter = app.adapters['nimoy']
+        db = adapter.db if adapter_cls is NimoyAdapter else None
+        calls = []
+        run_in_executor = app.run_in_executor
+
+        async def _counting_run_in_executor(fn, *args, **kwargs):
+            calls.append((fn.__name__, args[1]))
+            return await run_in_executor(fn, *args, **kwargs)
+
+        app.run_in_executor = _counting_run_in_executor
+
+        def _get(_id):
+            return app.f_('nimoy.get_item', schema_name='book', _id=_id)
+
+        async def _gets():
+            return await asyncio.gather(*[_get(i % 3) for i in range(9)])
+
+        assert app.event_loop.run_until_complete(_gets()) == [{'_id': i % 3} for i in range(9)]
+        assert calls == [('get_item', 0), ('get_item', 1), ('get_item', 2)]
+        assert (adapter.cache.hits, adapter.cache.misses) == (0, 9)
+        app.event_loop.run_until_complete(_get(1))
+        assert adapter.cache.hits == 1 and len(calls) == 3
+
+        app.event_loop.run_until_complete(
+            app.f_('nimoy.put_item', schema_name='book', _data={'_id': 1, 'title': 'Dune'}))
+        assert app.event_loop.run_until_complete(_get(1)) == {'_id': 1, 'title': 'Dune'}
+        app.event_loop.run_until_complete(app.f_('nimoy.delete_item', schema_name='book', _id=1))
+        assert isinstance(app.event_loop.run_until_complete(_missing(app, 1)), ItemNotFoundError)
+        assert calls[3:] == [('put_item', {'_id': 1, 'title': 'Dune'}), ('get_item', 1),
+                             ('delete_item', 1), ('get_item', 1)]
+        assert db is None or db.calls == [(name, arg if name != 'put_item' else 1) for name, arg in calls]
+
+
+def test_nimoy_adapter_cache_w_batching_reads_after_writes():
+    tables = {'book': {1: {'_id': 1, 'title': 'old'}}}
+    batch_started, release = asyncio.Event(), asyncio.Event()
+
+    class GatedDatabase(object):
+        def __init__(self, tables):
+            self.tables = tables
+
+        async def batch_get_items(self, schema_name, _ids):
+            items = [self.tables[schema_name].get(_id) for _id in _ids]
+            batch_started.set()
+            await release.wait()
+            return items
+
+        async def put_item(self, schema_name, _data):
+            self.tables[schema_name][_data['_id']] = _data
+            return _data
+
+    class _Adapter(PooledNimoyAdapter):
+        def create_connection(self):
+            return GatedDatabase(tables)
+
+    app = Application(config={'nimoy_cache': {'ttl': 60}, 'nimoy_batching': {'window': 0}},
+                      adapters={'nimoy': _Adapter})
+
+    def _get():
+        return app.f_('nimoy.get_item', schema_name='book', _id=1)
+
+    async def _interleaved():
+        before = asyncio.ensure_future(_get())
+        await batch_started.wait()
+        await app.f_('nimoy.put_item', schema_name='book', _data={'_id': 1, 'title': 'new'})
+        after = asyncio.ensure_future(_get())
+        await asyncio.sleep(0)
+        release.set()
+        return await before, await after, await _get()
+
+    before, after, cached = app.event_loop.run_until_complete(_interleaved())
+    assert before['title'] == 'old'
+    assert after['title'] == cached['title'] == 'new'
+
+
+def test_nimoy_adapter_query_iter():
+    for adapter_cls in [NimoyAdapter, PooledNimoyAdapter]:
+        app = _app(adapter_cls, FakeBlockingDatabase)
+        cursors = []
+        run_in_executor = app.run_in_executor
+
+        async def _counting_run_in_executor(fn, *args, **kwargs):
+            cursors.append(args[3])
+            return await run_in_executor(fn, *args, **kwargs)
+
+        app.run_in_executor = _counting_run_in_executor
+
+        async def _all(fn_name='nimoy.query_iter', **kwargs):
+            items = await app.f_(fn_name, schema_name='book', _w=lambda item: item['_id'] > 0, **kwargs)
+            return [item async for item in items]
+
+        for prefetch in [0, 1, 3]:
+            del cursors[:]
+            items = app.event_loop.run_until_complete(_all(page_size=4, prefetch=prefetch))
+            assert items == [{'_id': i} for i in range(1, 10)]
+            assert cursors == [None, 4, 8]
+        del cursors[:]
+        assert app.event_loop.run_until_complete(_all(page_size=3)) == [{'_id': i} for i in range(1, 10)]
+        assert cursors == [None, 3, 6]
+
+
+def test_nimoy_adapter_query_iter_falls_back_to_lazy_query():
+    class LazyDatabase(object):
+        """Like nimoy connections, query and scan return generators and there are no paging methods."""
+        read = 0
+        limits = []
+
+        def __init__(self, tables):
+            self.tables = tables
+
+        def _items(self, schema_name, _w, limit):
+            LazyDatabase.limits.append(limit)
+            for item in self.tables[schema_name].values():
+                LazyDatabase.read += 1
+                if _w(item):
+                    yield item
+
+        query = scan = _items
+
+    for adapter_cls in [NimoyAdapter, PooledNimoyAdapter]:
+        app = _app(adapter_cls, LazyDatabase)
+        adapter = app.adapters['nimoy']
+
+        async def _first_and_rest(method):
+            items = getattr(adapter, method)('book', lambda item: item['_id'] % 2 == 0, page_size=2, prefetch=0)
+            first = await items.__anext__()
+            read = LazyDatabase.read
+            return first, read, [item async for item in items]
+
+        for method in ['query_iter', 'scan_iter']:
+            LazyDatabase.read, LazyDatabase.limits = 0, []
+            first, read, rest = app.event_loop.run_until_complete(_first_and_rest(method))
+            assert first == {'_id': 0} and read == 3  # one page of two items, not the whole table
+            assert [first] + rest == [{'_id': i} for i in range(0, 10, 2)]
+            assert LazyDatabase.limits == [None]
+
+
+def test_nimoy_adapter_query_iter_prefetches_bounded():
+    FakeDatabase.page_calls = []
+    app = _app(PooledNimoyAdapter, FakeDatabase)
+
+    async def _first():
+        items = await app.f_('nimoy.query_iter', schema_name='book', _w=lambda item: True, page_size=2, prefetch=2)
+        first = await items.__anext__()
+        for _ in range(50):  # everything runs on the loop, plenty of turns to fetch too much
+            await asyncio.sleep(0)
+        page_calls = list(FakeDatabase.page_calls)
+        await items.aclose()
+        return first, page_calls, [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+
+    first, page_calls, pending_tasks = app.event_loop.run_until_complete(_first())
+    assert first == {'_id': 0}
+    assert page_calls == [None, 2, 4]  # the page consumed and two prefetched, no more
+    assert pending_tasks == [] and app.adapters['nimoy'].connection_pool.in_use == 0
+
+
+def test_nimoy_adapter_query_iter_errors():
+    app = _app(NimoyAdapter, FakeBlockingDatabase)
+
+    def _w(item):
+        if item['_id'] == 5:
+            raise ConnectionError()
+        return True
+
+    async def _all():
+        items = await app.f_('nimoy.query_iter', schema_name='book', _w=_w, page_size=2)
+        return [item async for item in items]
+
+    with pytest.raises(ConnectionError):
+        app.event_loop.run_until_complete(_all())
+
+
+def test_http_bridge_streams_async_iterators():
+    from aiohttp.test_utils import TestClient, TestServer
+    from centaur.bridges import HTTPBridge
+
+    class Books(Adapter):
+        async def all(self):
+            return await self.f_('nimoy.query_iter', schema_name='book', _w=lambda item: True, page_size=3)
+
+        async def failing(self):
+            async def _items():
+                yield {'_id': 0}
+                raise ValueError('database gone')
+            return _items()
+
+        async def invalid(self):
+            async def _items():
+                raise ValidationError('invalid query')
+                yield
+            return _items()
+
+    app = _app(NimoyAdapter, FakeBlockingDatabase)
+    app.adapters['books'] = Books(app)
+    bridge = HTTPBridge(app)
+    for name in ['all', 'failing', 'invalid']:
+        bridge.add_route('GET', '/' + name, 'books.' + name)
+
+    async def _get(path, accept):
+        async with TestClient(TestServer(bridge._aiohttp_app)) as client:
+            response = await client.get(path, headers={'Accept': accept})
+            return (response.status, response.headers['Content-Type'], response.headers.get('Transfer-Encoding'),
+                    await response.text())
+
+    status, content_type, encoding, text = app.event_loop.run_until_complete(_get('/all', 'application/x-ndjson'))
+    assert (status, content_type, encoding) == (200, 'application/x-ndjson', 'chunked')
+    assert [json.loads(line) for line in text.splitlines()] == [{'_id': i} for i in range(10)]
+    _, content_type, _, text = app.event_loop.run_until_complete(_get('/all', 'application/json'))
+    assert content_type == 'application/json' and json.loads(text) == [{'_id': i} for i in range(10)]
+
+    _, _, _, text = app.event_loop.run_until_complete(_get('/failing', 'application/x-ndjson'))
+    assert [json.loads(line) for line in text.splitlines()] == [{'_id': 0}, {'error': 'database gone'}]
+    _, _, _, text = app.event_loop.run_until_complete(_get('/failing', 'application/json'))
+    assert text == '[{"_id": 0}'
+    status, _, _, text = app.event_loop.run_until_complete(_get('/invalid', 'application/x-ndjson'))
+    assert status == 400 and json.loads(text) == {'error': 'invalid query'}
+
+
+async def _missing(app, _id=99):
+    try:
+        await app.f_('nimoy.get_item', schema_name='book', _id=_id)
+    except ItemNotFoundError as e:
+        return e
@@ -1,4 +1,6 @@
 import pytest
+import pickle
+import re
 import os
 import datetime
 from centaur import datatypes as dt
@@ -287,3 +289,360 @@ def test_guard_with_custom_exception_template():
 def test_load_module_from_file():
     module_ = dt.load_module(sample_service_yml_file)
     assert module_ is not None
+
+
+def _guard_result(guard, value):
+    try:
+        return guard(value)
+    except dt.ValidationError as e:
+        return 'ValidationError: {}'.format(e)
+
+
+compile_sample_dts = dt.def_datatypes({
+    'short': {'type': 'string', 'length_max': 5, 'regex': '^[a-z]+$'},
+    'shorter': {'type': 'short', 'length_max': 3, 'not_in': ['abc']},
+    'alias': {'type': 'shorter'},
+    'user': {
+        'type': 'dict',
+        'required': ['name'],
+        'fields': {
+            'name': {'type': 'shorter'},
+            'age': {'type': 'integer', 'gte': 0},
+            'tags': {'type': 'list', 'length_max': 2, 'items': {'type': 'string', 'in': ['A', 'B']}},
+            'email': {'type': 'maybe', 'base': {'type': 'string', 'contains': '@'}},
+            'id': {'type': 'union', 'types': [{'type': 'integer'}, {'type': 'string', 'length': 4}]},
+        }},
+    'tree': {'type': 'dict', 'fields': {'value': {'type': 'number'}, 'children': {'type': 'list', 'items': {'type': 'tree'}}}},
+})
+
+
+@pytest.mark.parametrize('name, value', [
+    ('short', 'abc'), ('short', 'abcdef'), ('short', 'AB'), ('short', 1),
+    ('shorter', 'ab'), ('shorter', 'abc'), ('shorter', 'abcd'), ('alias', 'abcd'), ('alias', 'ab'),
+    ('user', {'name': 'ab'}), ('user', {'age': 1}), ('user', {'name': 'ab', 'age': -1}),
+    ('user', {'name': 'ab', 'tags': ['A', 'C']}), ('user', {'name': 'ab', 'tags': ['A', 'B', 'A']}),
+    ('user', {'name': 'ab', 'email': None}), ('user', {'name': 'ab', 'email': 'x'}),
+    ('user', {'name': 'ab', 'id': 12}), ('user', {'name': 'ab', 'id': '12'}), ('user', []),
+    ('tree', {'value': 1, 'children': [{'value': 2, 'children': []}]}),
+    ('tree', {'value': 1, 'children': [{'value': 2, 'children': [{'value': '3'}]}]}),
+])
+def test_compiled_datatype_same_as_guard(name, value):
+    datatype = compile_sample_dts[name]
+    validator = datatype.compile()
+    assert _guard_result(validator, value) == _guard_result(datatype.guard, value)
+    assert validator.fulfill(value) == datatype.fulfill(value)
+
+
+def test_compiled_datatype_is_cached_and_uses_error_templates():
+    book_dt = dt.def_datatype({'type': 'dict', 'fields': {'author': {'type': 'string', 'length_min': 5}}})
+    validator = book_dt.compile()
+    assert book_dt.compile() is validator
+    book_dt._ctx.error_templates['length_min'] = 'The string is two small: {value}'
+    with pytest.raises(dt.ValidationError) as e:
+        validator({'author': 'sm'})
+    assert str(e.value) == 'The string is two small: \'sm\''
+    with pytest.raises(KeyError):
+        validator({'title': 'Unknown field'})
+
+
+def test_compiled_datatype_with_unknown_base_fails_at_validation():
+    validator = dt.def_datatype({'type': 'missing_type'}).compile()
+    with pytest.raises(KeyError):
+        validator('value')
+
+
+def test_extended_datatype_options_are_cached_until_ctx_changes():
+    dts = dt.def_datatypes({
+        'base': {'type': 'string', 'length_min': 2},
+        'extended': {'type': 'base', 'length_max': 3},
+    })
+    extended = dts['extended']
+    assert extended.get_options() is extended.get_options()
+    assert pickle.loads(pickle.dumps(extended)).get_options() == extended.get_options()
+    with pytest.raises(TypeError):
+        extended.get_options()['length_max'] = 1
+    assert dt.fulfill('a', extended) is False
+    validator = extended.compile()
+
+    options = extended.get_options()
+    dts.def_datatype({'type': 'string', 'length_min': 1}, name='base')
+    assert extended.get_options() is not options
+    assert extended.get_options() == {'length_min': 1, 'type': 'base', 'length_max': 3}
+    assert dt.fulfill('a', extended) is True
+    assert extended.compile() is not validator
+    assert extended.compile().fulfill('a') is True
+
+
+def test_compile_in_other_thread_waits_for_the_validator():
+    import threading
+
+    datatype = dt.def_datatype({'type': 'list', 'items': {'type': 'string'}})
+    compile_guard = datatype._compile_guard
+    started, release = threading.Event(), threading.Event()
+
+    def _slow_compile_guard(options=None):
+        started.set()
+        release.wait(5)
+        return compile_guard(options)
+
+    datatype._compile_guard = _slow_compile_guard
+    compiling = threading.Thread(target=datatype.compile)
+    compiling.start()
+    started.wait(5)
+    compiled = []
+    waiting = threading.Thread(target=lambda: compiled.append(datatype.compile()))
+    waiting.start()
+    release.set()
+    compiling.join()
+    waiting.join()
+    assert compiled == [datatype.compile()] and compiled[0].fulfill(['a']) and not compiled[0].fulfill([1])
+
+
+def test_linked_ctx_changes_invalidate_cached_options():
+    dts1 = dt.def_datatypes({'code': {'type': 'string', 'length': 3}})
+    dts2 = dt.def_datatypes({'my_code': {'type': 'dts1:code', 'contains': 'A'}})
+    dts2.link_ctx(dts1, prefix='dts1')
+    assert dt.fulfill('ABC', dts2['my_code'])
+    assert dts2['my_code'].compile().fulfill('ABCD') is False
+
+    dts1.def_datatype({'type': 'string', 'length': 4}, name='code')
+    assert dt.fulfill('ABCD', dts2['my_code'])
+    assert dts2['my_code'].compile().fulfill('ABCD') is True
+
+
+def test_frozen_ctx():
+    dts = dt.def_datatypes({
+        'base': {'type': 'string', 'length_min': 2},
+        'extended': {'type': 'base', 'length_max': 3},
+    })
+    default_ctx = dt.load_module({'datatypes': {}}).ctx.linked_ctxs['centaur']
+    dts.link_ctx(default_ctx, prefix='centaur')
+    assert dts.freeze() is dts
+    assert dts.frozen and default_ctx.frozen
+    assert dts['extended']._compiled is not None
+    assert dt.fulfill('abc', dts['extended'])
+    with pytest.raises(TypeError):
+        dts.def_datatype({'type': 'string'}, name='other')
+    with pytest.raises(TypeError):
+        dts.link_ctx(dt._Context.create_empty(), prefix='other')
+
+
+def test_default_ctx_is_shared():
+    from centaur.datatypes.defaults import get_default_ctx
+    m1 = dt.load_module({'datatypes': {'a': {'type': 'centaur:email'}}})
+    m2 = dt.load_module({'datatypes': {'b': {'type': 'centaur:url'}}})
+    assert m1.ctx.linked_ctxs['centaur'] is m2.ctx.linked_ctxs['centaur'] is get_default_ctx()
+    assert get_default_ctx().frozen
+    with pytest.raises(TypeError):
+        get_default_ctx().def_datatype({'type': 'string'}, name='email')
+
+
+def test_ctx_overlay():
+    from centaur.datatypes.defaults import get_default_ctx
+    default_ctx = get_default_ctx()
+    overlay = default_ctx.overlay()
+    overlay.def_datatypes({
+        'url': {'type': 'string', 'length_max': 3},
+        'work_email': {'type': 'email', 'regex': '.*@example.com$'},
+    })
+    assert dt.fulfill('abc', overlay['url'])
+    assert not dt.fulfill('abc', default_ctx['url'])
+    assert overlay['date'] is default_ctx['date']
+    assert overlay['centaur:url'] is default_ctx['url']
+    assert dt.fulfill('john@example.com', overlay['work_email'])
+    assert not dt.fulfill('john@example.org', overlay['work_email'])
+    assert 'work_email' not in dict(default_ctx.items())
+    with pytest.raises(KeyError):
+        overlay['unknown']
+
+
+def test_guard_many_same_as_guard():
+    for name, value in [
+            ('short', 'abc'), ('short', 1), ('shorter', 'abc'), ('alias', 'abcd'),
+            ('user', {'name': 'ab', 'age': -1}), ('user', {'name': 'ab', 'tags': ['A', 'C']}),
+            ('user', {'name': 'ab', 'email': 'x'}), ('user', {'name': 'ab', 'id': '12'}), ('user', {'age': 1}),
+            ('tree', {'value': 1, 'children': [{'value': 2, 'children': [{'value': '3'}]}]})]:
+        datatype = compile_sample_dts[name]
+        values = [value, value, value]
+        results = [r if r is True else 'ValidationError: {}'.format(r) for r in dt.guard_many(values, datatype)]
+        assert results == [_guard_result(datatype.guard, v) for v in values]
+        assert dt.fulfill_many(values, datatype) == [datatype.fulfill(v) for v in values]
+
+
+def test_guard_many_reports_errors_per_item():
+    user_dt = compile_sample_dts['user']
+    values = [{'name': 'ab'}, {'name': 'ab', 'age': -1}, [], {'name': 'abc'}, {'name': 'ab', 'tags': ['B', 'X']}]
+    results = dt.guard_many(values, user_dt)
+    assert results[0] is True
+    for value, result in zip(values[1:], results[1:]):
+        assert isinstance(result, dt.ValidationError)
+        with pytest.raises(dt.ValidationError) as e:
+            dt.guard(value, user_dt)
+        assert str(result) == str(e.value)
+
+
+def test_guard_many_returns_validation_error_for_unknown_fields():
+    user_dt = compile_sample_dts['user']
+    value = {'name': 'ab', 'unknown': 1}
+    with pytest.raises(KeyError):
+        dt.guard(value, user_dt)
+    results = dt.guard_many([{'name': 'ab'}, value], user_dt)
+    assert results[0] is True and isinstance(results[1], dt.ValidationError)
+    assert 'unknown' in str(results[1])
+
+
+@pytest.mark.parametrize('definition', [
+    {'type': 'number', 'gt': 0, 'lte': 10.5},
+    {'type': 'integer', 'enum': [1, 2, 3]},
+    {'type': 'number', 'not_in': [0, 2 ** 60], 'ne': 1},
+    {'type': 'number', 'eq': 2 ** 60 + 1},
+])
+def test_guard_many_numeric_values(definition):
+    number_dt = dt.def_datatype(definition)
+    values = [-1, 0, 1, 2, 3.0, 10.5, 11, float('nan'), 2 ** 60, 2 ** 60 + 1, True, '1']
+    assert dt.fulfill_many(values, number_dt) == [dt.fulfill(v, number_dt) for v in values]
+    np = pytest.importorskip('numpy')
+    assert dt.fulfill_many(np.arange(5), number_dt) == [dt.fulfill(v, number_dt) for v in range(5)]
+
+
+def test_regex_is_compiled_when_the_datatype_is_defined():
+    url_dt = dt.def_datatype({'type': 'string', 'regex': url_regex})
+    assert list(url_dt._regex_matchers) == [url_regex]
+    assert dt.fulfill('https://example.com', url_dt)
+    assert list(url_dt._regex_matchers) == [url_regex]
+
+
+@pytest.mark.parametrize('name, value, result', [
+    ('centaur:email', 'john.doe@example.com', True),
+    ('centaur:email', 'john.doe.example.com', False),
+    ('centaur:url', 'http://example.com', True),
+    ('centaur:url', 'ftp://example.com', False),
+    ('centaur:date', '2016-02-29', True),
+    ('centaur:date', '20160229', True),
+    ('centaur:date', '2016-02-29\n', True),
+    ('centaur:date', '2016-2-29', False),
+    ('centaur:date', '2016-02-29T10:00', False),
+])
+def test_default_regex_prechecks(name, value, result):
+    datatype = dt.load_module({'datatypes': {}})[name]
+    assert datatype.fulfill(value) is result
+    assert (re.match(datatype._options['regex'], value) is not None) is result
+
+
+def test_regex_prechecks_stay_on_default_datatypes():
+    from centaur.datatypes.defaults import DATE_REGEX
+    own_date = dt.def_datatypes({'own_date': {'type': 'string', 'regex': DATE_REGEX}})['own_date']
+    assert own_date._regex_prechecks == {}
+    default_date = pickle.loads(pickle.dumps(dt.load_module({'datatypes': {}})['centaur:date']))
+    assert default_date._regex_prechecks
+    assert default_date.fulfill('2016-02-29') and not default_date.fulfill('2016-02-29T10:00')
+
+
+def test_validate_collect_all():
+    dts = dt.def_datatypes({
+        'user': {'type': 'dict', 'required': ['name', 'email'], 'fields': {
+            'name': {'type': 'string', 'length_min': 2, 'regex': '^[a-z]+$'},
+            'email': {'type': 'string', 'regex': '.*@.*'},
+            'age': {'type': 'maybe', 'base': {'type': 'integer', 'gte': 0}},
+            'tags': {'type': 'list', 'items': {'type': 'string', 'length_max': 3}},
+        }},
+        'admin': {'type': 'user', 'length_max': 3},
+    })
+    valid = {'name': 'jo', 'email': 'jo@example.com', 'age': None, 'tags': ['a']}
+    invalid = {'name': 'J', 'age': -1, 'tags': ['ab', 'abcd', 1]}
+    assert dts['user'].validate(valid) == []
+    assert dts['user'].validate(valid, collect_all=True) == []
+    assert dts['user'].validate(invalid) == [dt.ErrorItem('email', 'required', True, None)]
+    assert dts['user'].validate(invalid, collect_all=True) == [
+        ('email', 'required', True, None),
+        ('name', 'length_min', 2, 'J'),
+        ('name', 'regex', '^[a-z]+$', 'J'),
+        ('age', 'gte', 0, -1),
+        ('tags[1]', 'length_max', 3, 'abcd'),
+        ('tags[2]', 'type', 'StringDatatype', 1),
+    ]
+    assert dts['admin'].validate(dict(valid, email=1), collect_all=True, path='body') == [
+        ('body.email', 'type', 'StringDatatype', 1),
+        ('body', 'length_max', 3, dict(valid, email=1)),
+    ]
+    assert dts['user'].validate(dict(valid, extra=None, name=1), collect_all=True) == [
+        ('name', 'type', 'StringDatatype', 1),
+        ('extra', 'fields', ['name', 'email', 'age', 'tags'], None),
+    ]
+    for value in [valid, invalid, {'name': 'x'}, [], {'tags': 'abc'}]:
+        for datatype in [dts['user'], dts['admin']]:
+            assert (datatype.validate(value) == []) == datatype.fulfill(value)
+
+
+def test_guard_patch():
+    dts = dt.def_datatypes({
+        'doc': {'type': 'dict', 'required': ['title'], 'length_max': 4, 'fields': {
+            'title': {'type': 'string', 'length_min': 1},
+            'meta': {'type': 'dict', 'required': ['author'], 'fields': {
+                'author': {'type': 'string'},
+                'tags': {'type': 'list', 'items': {'type': 'string'}},
+            }},
+            'note': {'type': 'maybe', 'base': {'type': 'dict', 'fields': {'text': {'type': 'string'}}}},
+            'count': {'type': 'integer'},
+            'extra': {'type': 'string'},
+        }},
+        'ext_doc': {'type': 'doc'},
+    })
+    original = {'title': 'a', 'meta': {'author': 'x', 'tags': ['t']}, 'note': {'text': 'n'}}
+    assert dt.guard(original, dts['doc'])
+    for datatype in [dts['doc'], dts['ext_doc']]:
+        merged = datatype.guard_patch(original, {'meta': {'tags': ['u']}, 'note': {'text': 'm'}})
+        assert merged == {'title': 'a', 'meta': {'author': 'x', 'tags': ['u']}, 'note': {'text': 'm'}}
+        assert original['meta']['tags'] == ['t']
+        assert datatype.guard_patch(original, {'note': None})['note'] is None
+        for bad_patch in [{'title': ''}, {'meta': {'author': 1}}, {'meta': 'x'}, {'note': {'text': 1}},
+                          {'count': 1, 'extra': 'e'}, []]:
+            with pytest.raises(dt.ValidationError):
+                datatype.guard_patch(original, bad_patch)
+        with pytest.raises(KeyError):
+            datatype.guard_patch(original, {'unknown': 1})
+    assert dt.guard_patch(original, {'count': 1}, dts['doc'])['count'] == 1
+
+
+def test_validation_cache():
+    dts = dt.def_datatypes({
+        'item': {'type': 'dict', 'fields': {'id': {'type': 'integer'}, 'tags': {'type': 'list'}}},
+        'items': {'type': 'list', 'items': {'type': 'item'}},
+    })
+    cache = dts.enable_validation_cache(maxsize=2)
+    payload = [{'id': 1, 'tags': ['a']}, {'id': 2, 'tags': []}]
+    assert dt.guard(payload, dts['items'])
+    assert dt.guard([{'id': 1, 'tags': ['a']}, {'id': 2, 'tags': []}], dts['items'])
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    payload[1]['id'] = 'x'
+    with pytest.raises(dt.ValidationError):
+        dts['items'].guard(payload)
+    with pytest.raises(dt.ValidationError):
+        dts['items'].guard(payload)
+    assert not dts['items'].fulfill(payload)
+    assert (cache.hits, cache.misses) == (3, 2)
+
+    assert dt.guard({'id': True}, dts['item'])
+    assert len(cache) == 2
+    assert dt.guard([{'id': 1, 'tags': ['a']}, {'id': 2, 'tags': []}], dts['items'])
+    assert (cache.hits, cache.misses) == (3, 4)
+
+    dts.def_datatype({'type': 'dict', 'fields': {'id': {'type': 'string'}}}, name='item')
+    assert dt.fulfill({'id': 'x'}, dts['item'])
+    assert cache.misses == 5
+
+
+def test_validation_cache_ttl():
+    from centaur.datatypes.cache import ValidationCache
+    now = [0]
+    string_list = dt.def_datatype({'type': 'list', 'items': {'type': 'string'}})
+    cache = string_list._ctx.validation_cache = ValidationCache(ttl=10, timer=lambda: now[0])
+    for t in [0, 5, 10, 12]:
+        now[0] = t
+        assert string_list.guard(['a', 'b'])
+    assert (cache.hits, cache.misses) == (2, 2)
+    assert string_list.guard('abc'.split()) and string_list.guard([object()] * 0)
+    with pytest.raises(dt.ValidationError):
+        string_list.guard([object()])
+    assert len(cache) == 3
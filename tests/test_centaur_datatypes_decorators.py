@@ -1,4 +1,7 @@
+import asyncio
+from centaur.applications import Application, Adapter
 from centaur.datatypes import ValidationError, validate_args, def_datatypes, load_module
+from centaur.datatypes.decorators import _payload_exceeds
 from centaur.utils import select_items
 import pytest
 
@@ -104,3 +107,193 @@ def test_validate_args_w_module():
             _test_fn(1)
 
     assert _test_fn("a") == "a"
+
+
+def test_validate_args_resolves_datatypes_once():
+    ctx = def_datatypes({})
+
+    @validate_args(ctx=ctx)
+    def _test_fn(param: {'type': 'string', 'length_min': 1}):
+        return param
+
+    n_datatypes = len(list(ctx.items()))
+    for _ in range(10):
+        assert _test_fn("a") == "a"
+        with pytest.raises(ValidationError):
+            _test_fn("")
+    assert len(list(ctx.items())) == n_datatypes
+
+
+def test_validate_args_w_datatype_defined_later():
+    ctx = def_datatypes({})
+
+    @validate_args(ctx=ctx)
+    def _test_fn(param: 'later'):
+        return param
+
+    with pytest.raises(KeyError):
+        _test_fn("a")
+    ctx.def_datatype({'type': 'string', 'length_min': 1}, name='later')
+    assert _test_fn("a") == "a"
+    with pytest.raises(ValidationError):
+        _test_fn("")
+
+
+def test_validate_args_sees_redefined_datatypes():
+    ctx = def_datatypes({'name': {'type': 'string', 'length_min': 1}})
+
+    @validate_args(ctx=ctx)
+    def _test_fn(param: 'name'):
+        return param
+
+    assert _test_fn("ab") == "ab"
+    ctx.def_datatype({'type': 'string', 'length_min': 3}, name='name')
+    with pytest.raises(ValidationError):
+        _test_fn("ab")
+
+
+def test_validate_args_definitions_fail_at_decoration():
+    ctx = def_datatypes({})
+    n_datatypes = len(list(ctx.items()))
+    with pytest.raises(AttributeError):
+        @validate_args(ctx=ctx, param={'type': 'dict', 'fields': {'a': 'not a definition'}})
+        def _test_fn(param):
+            return param
+    ctx.freeze()
+
+    @validate_args(ctx=ctx, param={'type': 'string', 'length_min': 1})
+    def _frozen_ctx_fn(param):
+        return param
+
+    assert _frozen_ctx_fn("a") == "a"
+    with pytest.raises(ValidationError):
+        _frozen_ctx_fn("")
+    assert len(list(ctx.items())) == n_datatypes  # the frozen ctx is left alone
+
+
+def test_validate_args_call_forms():
+    @validate_args(a={'type': 'integer'}, c={'type': 'string'})
+    def _test_fn(a, b=None, *args, c='x', **kwargs):
+        return a, b, args, c, kwargs
+
+    @validate_args(a={'type': 'integer'}, c={'type': 'string'})
+    def _test_simple_fn(a, b=None, *, c='x'):
+        return a, b, c
+
+    assert _test_fn(1, 2, 3, c='y', d=4) == (1, 2, (3,), 'y', {'d': 4})
+    assert _test_simple_fn(b=2, a=1) == (1, 2, 'x')
+    for fn in [_test_fn, _test_simple_fn]:
+        with pytest.raises(ValidationError):
+            fn('1')
+        with pytest.raises(ValidationError):
+            fn(a=1, c=2)
+    with pytest.raises(TypeError):
+        _test_simple_fn(1, a=1)
+    with pytest.raises(TypeError):
+        _test_simple_fn(1, 2, 3)
+    with pytest.raises(TypeError):
+        _test_simple_fn(1, d=3)
+
+
+def test_validate_args_w_coroutine_function():
+    @validate_args(param={'type': 'string', 'length_min': 1})
+    async def _test_fn(param):
+        return param
+
+    loop = asyncio.new_event_loop()
+    assert asyncio.iscoroutinefunction(_test_fn)
+    assert loop.run_until_complete(_test_fn("a")) == "a"
+    with pytest.raises(ValidationError):
+        loop.run_until_complete(_test_fn(""))
+    loop.close()
+
+
+def test_payload_exceeds():
+    assert not _payload_exceeds([], 0)
+    assert not _payload_exceeds([1, 'abc'], 2)
+    assert _payload_exceeds([1, 'abc', 3], 2)
+    assert not _payload_exceeds([{'a': [1, 2], 'b': {'c': 3}}], 6)
+    assert _payload_exceeds([{'a': [1, 2], 'b': {'c': 3}}], 5)
+
+
+def test_validate_args_offloads_large_payloads():
+    offloaded = []
+
+    async def _executor(fn, *args):
+        offloaded.append(args)
+        return fn(*args)
+
+    @validate_args(offload_above=3, executor=_executor, param={'type': 'list', 'items': {'type': 'integer'}})
+    async def _test_fn(param):
+        return param
+
+    loop = asyncio.new_event_loop()
+    assert loop.run_until_complete(_test_fn([1, 2])) == [1, 2]
+    assert offloaded == []
+    assert loop.run_until_complete(_test_fn([1, 2, 3, 4])) == [1, 2, 3, 4]
+    assert len(offloaded) == 1
+    with pytest.raises(ValidationError):
+        loop.run_until_complete(_test_fn([1, 2, 3, 'a']))
+    loop.close()
+
+
+class OffloadingAdapter(Adapter):
+    @validate_args(offload_above=10, items={'type': 'list', 'items': {'type': 'integer'}})
+    async def count(self, items):
+        return len(items)
+
+
+def test_validate_args_offloads_to_application_executor():
+    app = Application(adapters={'sample': OffloadingAdapter})
+    offloaded = []
+    run_in_executor = app.run_in_executor
+
+    async def _run_in_executor(fn, *args, **kwargs):
+        offloaded.append(fn)
+        return await run_in_executor(fn, *args, **kwargs)
+
+    app.run_in_executor = _run_in_executor
+    assert app.event_loop.run_until_complete(app.f_('sample.count', items=[1])) == 1
+    assert app.event_loop.run_until_complete(app.f_('sample.count', items=list(range(100)))) == 100
+    assert len(offloaded) == 1
+    with pytest.raises(ValidationError):
+        app.event_loop.run_until_complete(app.f_('sample.count', items=list(range(100)) + ['a']))
+
+
+def test_validate_args_offloads_to_process_pool():
+    app = Application(config={'executors': {'default': {'kind': 'process', 'max_workers': 1}}},
+                      adapters={'sample': OffloadingAdapter})
+    try:
+        assert app.event_loop.run_until_complete(app.f_('sample.count', items=list(range(100)))) == 100
+        assert app.executors['default'].completed == 1
+        with pytest.raises(ValidationError) as e:
+            app.event_loop.run_until_complete(app.f_('sample.count', items=list(range(100)) + ['a']))
+        assert [err.path for err in e.value.errors] == ['items[100]']
+    finally:
+        app.shutdown_executors()
+
+
+def test_validate_args_error_report():
+    from centaur.bridges import validation_error_report, to_json
+
+    @validate_args(user={'type': 'dict', 'required': ['name'], 'fields': {
+        'name': {'type': 'string'},
+        'emails': {'type': 'list', 'items': {'type': 'string', 'regex': '.*@.*'}}}})
+    def _test_fn(user):
+        return user
+
+    with pytest.raises(ValidationError) as e:
+        _test_fn({'emails': ['a@b', 'ab', 'cd']})
+    assert [tuple(err) for err in e.value.errors] == [
+        ('user.name', 'required', True, None),
+        ('user.emails[1]', 'regex', '.*@.*', 'ab'),
+        ('user.emails[2]', 'regex', '.*@.*', 'cd'),
+    ]
+    with pytest.raises(ValidationError) as unknown:
+        _test_fn({'name': 'x', 'phone': '123'})
+    assert str(unknown.value) == 'Unknown fields: user.phone'
+    assert [tuple(err) for err in unknown.value.errors] == [('user.phone', 'fields', ['name', 'emails'], '123')]
+    report = validation_error_report(e.value)
+    assert report['error'] == str(e.value)
+    assert report['errors'][1] == {'path': 'user.emails[1]', 'option': 'regex', 'expected': '.*@.*', 'actual': 'ab'}
+    assert to_json(report)
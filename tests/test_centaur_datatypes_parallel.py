@@ -0,0 +1,83 @@
+import pickle
+import pytest
+from centaur.datatypes import def_datatypes, load_module, ParallelListValidator, ValidationError
+
+
+@pytest.fixture
+def dts():
+    return load_module({'datatypes': {
+        'user': {'type': 'dict', 'fields': {'email': {'type': 'centaur:email'}, 'age': {'type': 'integer', 'gte': 0}}},
+        'users': {'type': 'list', 'length_min': 1, 'items': {'type': 'user'}},
+        'some_users': {'type': 'users', 'length_max': 100},
+    }})
+
+
+def _users(n):
+    return [{'email': 'user{}@example.com'.format(i), 'age': i} for i in range(n)]
+
+
+def test_datatypes_can_be_pickled(dts):
+    users_dt = pickle.loads(pickle.dumps(dts['users']))
+    assert users_dt.guard(_users(3))
+    assert not users_dt.fulfill([{'email': 'x', 'age': 1}])
+
+
+def test_parallel_list_validator(dts):
+    users = _users(100)
+    with ParallelListValidator(dts['users'], max_workers=2, chunk_size=7, min_size=10) as validator:
+        assert validator.guard(users)
+        users[33]['age'] = -1
+        users[71]['email'] = 'invalid'
+        with pytest.raises(ValidationError) as e:
+            validator.guard(users)
+        with pytest.raises(ValidationError) as serial_e:
+            dts['users'].guard(users)
+        assert e.value.args == serial_e.value.args
+        assert not validator.fulfill(users)
+        assert not validator.fulfill([])
+
+    with ParallelListValidator(dts['some_users'], max_workers=2, chunk_size=7, min_size=10,
+                               collect_all=True) as validator:
+        users.append({'email': 'a@example.com', 'age': 1.5})
+        with pytest.raises(ValidationError) as e:
+            validator.guard(users)
+        assert [tuple(err)[:3] for err in e.value.errors] == [
+            ('[33].age', 'gte', 0), ('[71].email', 'regex', e.value.errors[1].expected),
+            ('[100].age', 'type', 'IntegerDataType'), ('', 'length_max', 100)]
+        assert e.value.errors == dts['some_users'].validate(users, collect_all=True)
+        assert validator.guard(users[:5])
+        with pytest.raises(ValidationError) as e:
+            validator.guard(users[30:35])
+        assert [err.path for err in e.value.errors] == ['[3].age']
+
+
+def test_parallel_list_validator_reports_the_first_error_of_serial_guard(dts):
+    users = _users(120)
+    users[3]['age'] = -1
+    with ParallelListValidator(dts['some_users'], max_workers=1, chunk_size=50, min_size=10) as validator:
+        with pytest.raises(ValidationError) as e:
+            validator.guard(users)
+    with pytest.raises(ValidationError) as serial_e:
+        dts['some_users'].guard(users)
+    assert e.value.args == serial_e.value.args
+
+
+def test_anonymous_datatype_names_continue_after_pickling(dts):
+    ctx = pickle.loads(pickle.dumps(dts.ctx))
+    existing = dict(ctx.items())
+    assert 'user0' in existing  # the items of users
+    name = ctx.def_datatype({'type': 'user'}).name
+    assert name not in existing and name == dts.ctx.def_datatype({'type': 'user'}).name
+
+
+def test_parallel_list_validator_restarts_workers_on_change():
+    dts = def_datatypes({
+        'code': {'type': 'string', 'length': 2},
+        'codes': {'type': 'list', 'items': {'type': 'code'}},
+    })
+    codes = ['ab'] * 20
+    with ParallelListValidator(dts['codes'], max_workers=1, chunk_size=5, min_size=10) as validator:
+        assert validator.guard(codes)
+        dts.def_datatype({'type': 'string', 'length': 3}, name='code')
+        assert not validator.fulfill(codes)
+        assert validator.fulfill(['abc'] * 20)
@@ -0,0 +1,71 @@
+import io
+import json
+import pytest
+from centaur.datatypes import def_datatype, validate_stream, ValidationError
+
+
+record_dt = def_datatype({
+    'type': 'dict',
+    'required': ['id'],
+    'fields': {
+        'id': {'type': 'integer', 'gte': 0},
+        'name': {'type': 'string', 'length_max': 10},
+    }})
+
+sample_records = [
+    {'id': 1, 'name': 'first'},
+    {'id': -2, 'name': 'second'},
+    {'id': 3, 'name': 'a name which is too long'},
+    {'id': 12345678901234567890, 'name': 'big é'},
+    {'name': 'no id'},
+]
+
+
+def _summary(items):
+    return [(item.path, item.value, item.error is None) for item in items]
+
+
+def test_validate_ndjson_stream():
+    text = '\n'.join(json.dumps(r) for r in sample_records[:2]) + '\n\n' + \
+        '\n'.join(json.dumps(r) for r in sample_records[2:]) + '\n'
+    items = list(validate_stream(io.BytesIO(text.encode('utf-8')), record_dt, chunk_size=7))
+    assert _summary(items) == [
+        ('[0]', sample_records[0], True),
+        ('[1]', sample_records[1], False),
+        ('[2]', sample_records[2], False),
+        ('[3]', sample_records[3], True),
+        ('[4]', sample_records[4], False)]
+    assert all(isinstance(item.error, ValidationError) for item in items if item.error is not None)
+
+
+def test_validate_ndjson_stream_with_invalid_line():
+    items = list(validate_stream(io.StringIO('{"id": 1}\n{"id": \n{"id": 2}'), record_dt))
+    assert [item.error is None for item in items] == [True, False, True]
+    assert str(items[1].error).startswith('Invalid JSON record')
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 64, 65536])
+def test_validate_json_array_stream(chunk_size):
+    text = ' [\n' + ',\n  '.join(json.dumps(r) for r in sample_records) + '\n] '
+    items = list(validate_stream(io.BytesIO(text.encode('utf-8')), record_dt, format='json', chunk_size=chunk_size))
+    assert [item.value for item in items] == sample_records
+    assert [item.error is None for item in items] == [True, False, False, True, False]
+
+
+def test_validate_json_array_stream_numbers_split_between_chunks():
+    number_dt = def_datatype({'type': 'integer', 'gt': 100})
+    items = list(validate_stream(io.StringIO('[12345,6]'), number_dt, format='json', chunk_size=2))
+    assert _summary(items) == [('[0]', 12345, True), ('[1]', 6, False)]
+    assert list(validate_stream(io.StringIO('[ ]'), number_dt, format='json')) == []
+
+
+@pytest.mark.parametrize('text', ['{"id": 1}', '[{"id": 1} {"id": 2}]', '[{"id": 1},', '[{"id": 1'])
+def test_validate_json_array_stream_invalid_document(text):
+    with pytest.raises(ValueError):
+        list(validate_stream(io.StringIO(text), record_dt, format='json', chunk_size=4))
+
+
+def test_validate_yaml_stream():
+    text = 'id: 1\nname: first\n---\nid: -1\n'
+    items = list(validate_stream(io.StringIO(text), record_dt, format='yaml'))
+    assert _summary(items) == [('[0]', {'id': 1, 'name': 'first'}, True), ('[1]', {'id': -1}, False)]
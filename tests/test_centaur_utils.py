@@ -1,4 +1,5 @@
-from centaur.utils import wraps_w_signature, call_in_ctx, select_params_for_fn, without_items, with_items, deep_merge, IDGenerator, fill_defaults
+from centaur.utils import wraps_w_signature, call_in_ctx, select_params_for_fn, without_items, with_items, deep_merge, IDGenerator, fill_defaults, \
+    deep_merge_shared, param_names
 from inspect import signature, Signature, Parameter
 
 
@@ -33,6 +34,32 @@ def test_call_function_from_ctx():
     assert call_in_ctx(sample_ctx, sample_fn) == (10, 20, 30)
 
 
+def test_param_names_are_memoized():
+    import gc
+    from centaur import utils
+
+    class A:
+        def method(self, a, *args, b=None):
+            return a, b
+
+    def var_kw_fn(a, **kwargs):
+        return a, kwargs
+
+    assert param_names(A().method) == ('a', 'args', 'b')
+    assert A.method in utils._bound_param_names and A.method not in utils._param_names
+    assert select_params_for_fn({'a': 1, 'b': 2, 'c': 3}, A().method) == {'a': 1, 'b': 2}
+    assert call_in_ctx({'a': 1, 'c': 3, '_request': object()}, var_kw_fn) == (1, {})
+    assert param_names(len) == ('obj',)
+
+    def _select_for_new_fn(i):
+        return select_params_for_fn({'x{}'.format(i): i, 'y': 0}, eval('lambda x{}: None'.format(i)))
+
+    n_plans = len(utils._param_names)
+    assert [_select_for_new_fn(i) for i in range(10)] == [{'x{}'.format(i): i} for i in range(10)]
+    gc.collect()
+    assert len(utils._param_names) == n_plans
+
+
 def test_without_items_fn():
     a = {'a': 'a', 'b': 'b', 'c': 'c'}
     assert without_items(a, ['a']) == {'b': 'b', 'c': 'c'}
@@ -53,6 +80,19 @@ def test_deep_merge():
     assert m['c'] == {'D': 'D', 'E': 'E'}
 
 
+def test_deep_merge_copies():
+    a = {'a': [1], 'b': {'c': {'d': 1}, 'e': [2]}, 'f': 1}
+    b = {'b': {'c': {'g': 2}}, 'h': {'i': 3}}
+    for m in [deep_merge(a, b), deep_merge_shared(a, b)]:
+        assert m == {'a': [1], 'b': {'c': {'d': 1, 'g': 2}, 'e': [2]}, 'f': 1, 'h': {'i': 3}}
+        assert list(m) == ['a', 'b', 'f', 'h']
+    m = deep_merge(a, b)
+    assert m['a'] is not a['a'] and m['b']['e'] is not a['b']['e'] and m['h'] is not b['h']
+    m = deep_merge_shared(a, b)
+    assert m['a'] is a['a'] and m['b']['e'] is a['b']['e'] and m['h'] is b['h']
+    assert a == {'a': [1], 'b': {'c': {'d': 1}, 'e': [2]}, 'f': 1}
+
+
 def test_id_generator():
     g = IDGenerator()
     assert g.generate_id('sample') == 'sample0'
@@ -1,57 +1,59 @@
 import pytest
-from centaur.queries import parse_wt
+from unittest.mock import patch
+from centaur.queries import parse_wt, compile_wt, optimize_wt, QueryIndex, IndexedCollection
 
 
-@pytest.mark.parametrize(
-    'w, value, result', [
-        (('eq', 'name', 'Sample'), {'name': 'Sample'}, True),
-        (('eq', 'name', 'Sample'), {'name': 'NOOOOO'}, False),
+simple_wt_cases = [
+    (('eq', 'name', 'Sample'), {'name': 'Sample'}, True),
+    (('eq', 'name', 'Sample'), {'name': 'NOOOOO'}, False),
 
-        (('neq', 'name', 'Sample'), {'name': 'NOOOO'}, True),
-        (('neq', 'name', 'Sample'), {'name': 'Sample'}, False),
+    (('neq', 'name', 'Sample'), {'name': 'NOOOO'}, True),
+    (('neq', 'name', 'Sample'), {'name': 'Sample'}, False),
 
-        (('lt', 'age', 10), {'age': 9}, True),
-        (('lt', 'age', 10), {'age': 10}, False),
+    (('lt', 'age', 10), {'age': 9}, True),
+    (('lt', 'age', 10), {'age': 10}, False),
 
-        (('gt', 'age', 10), {'age': 11}, True),
-        (('gt', 'age', 10), {'age': 10}, False),
+    (('gt', 'age', 10), {'age': 11}, True),
+    (('gt', 'age', 10), {'age': 10}, False),
 
-        (('lte', 'age', 10), {'age': 9}, True),
-        (('lte', 'age', 10), {'age': 10}, True),
-        (('lte', 'age', 10), {'age': 11}, False),
+    (('lte', 'age', 10), {'age': 9}, True),
+    (('lte', 'age', 10), {'age': 10}, True),
+    (('lte', 'age', 10), {'age': 11}, False),
 
-        (('gte', 'age', 10), {'age': 11}, True),
-        (('gte', 'age', 10), {'age': 10}, True),
-        (('gte', 'age', 10), {'age': 9}, False),
+    (('gte', 'age', 10), {'age': 11}, True),
+    (('gte', 'age', 10), {'age': 10}, True),
+    (('gte', 'age', 10), {'age': 9}, False),
 
-        (('in', 'category', ['A', 'B']), {'category': 'A'}, True),
-        (('in', 'category', ['A', 'B']), {'category': 'B'}, True),
-        (('in', 'category', ['A', 'B']), {'category': 'C'}, False),
+    (('in', 'category', ['A', 'B']), {'category': 'A'}, True),
+    (('in', 'category', ['A', 'B']), {'category': 'B'}, True),
+    (('in', 'category', ['A', 'B']), {'category': 'C'}, False),
 
-        (('nin', 'category', ['A', 'B']), {'category': 'A'}, False),
-        (('nin', 'category', ['A', 'B']), {'category': 'B'}, False),
-        (('nin', 'category', ['A', 'B']), {'category': 'C'}, True),
+    (('nin', 'category', ['A', 'B']), {'category': 'A'}, False),
+    (('nin', 'category', ['A', 'B']), {'category': 'B'}, False),
+    (('nin', 'category', ['A', 'B']), {'category': 'C'}, True),
 
-        (('contains', 'tags', 'A'), {'tags': ['A', 'B']}, True),
-        (('contains', 'tags', 'B'), {'tags': ['A', 'B']}, True),
-        (('contains', 'tags', 'C'), {'tags': ['A', 'B']}, False),
+    (('contains', 'tags', 'A'), {'tags': ['A', 'B']}, True),
+    (('contains', 'tags', 'B'), {'tags': ['A', 'B']}, True),
+    (('contains', 'tags', 'C'), {'tags': ['A', 'B']}, False),
 
-        (('ncontains', 'tags', 'A'), {'tags': ['A', 'B']}, False),
-        (('ncontains', 'tags', 'B'), {'tags': ['A', 'B']}, False),
-        (('ncontains', 'tags', 'C'), {'tags': ['A', 'B']}, True),
+    (('ncontains', 'tags', 'A'), {'tags': ['A', 'B']}, False),
+    (('ncontains', 'tags', 'B'), {'tags': ['A', 'B']}, False),
+    (('ncontains', 'tags', 'C'), {'tags': ['A', 'B']}, True),
 
-        (('startswith', 'name', 'Example'), {'name': 'Example Name'}, True),
-        (('startswith', 'name', 'Example'), {'name': 'Not-Example Name'}, False),
+    (('startswith', 'name', 'Example'), {'name': 'Example Name'}, True),
+    (('startswith', 'name', 'Example'), {'name': 'Not-Example Name'}, False),
 
-        (('endswith', 'name', 'Example'), {'name': 'First Example'}, True),
-        (('endswith', 'name', 'Example'), {'name': 'Second Example End'}, False),
+    (('endswith', 'name', 'Example'), {'name': 'First Example'}, True),
+    (('endswith', 'name', 'Example'), {'name': 'Second Example End'}, False),
 
-        (('is', 'required', True), {'required': False}, False),
-        (('is', 'required', True), {'required': 1}, False),
-        (('is', 'required', True), {'required': 'True'}, False),
-        (('is', 'required', True), {'required': True}, True),
+    (('is', 'required', True), {'required': False}, False),
+    (('is', 'required', True), {'required': 1}, False),
+    (('is', 'required', True), {'required': 'True'}, False),
+    (('is', 'required', True), {'required': True}, True),
+]
 
-    ])
+
+@pytest.mark.parametrize('w, value, result', simple_wt_cases)
 def test_parse_wt_simple(w, value, result):
     wq = parse_wt(w)
     assert wq.check(value) is result
@@ -143,3 +145,335 @@ def test_to_list_is_parse_wt_compatible():
 def test_to_list_wempty_strage_cornercase():
     assert parse_wt(None).to_list() is None
     assert parse_wt(None) == parse_wt(None)
+
+
+@pytest.mark.parametrize('w, value, result', simple_wt_cases)
+def test_compiled_wt_simple(w, value, result):
+    assert compile_wt(w)(value) is result
+
+
+@pytest.mark.parametrize('w, value', [
+    (('and', ('eq', 'name', 'Sample'), ('gt', 'age', 18)), {}),
+    (('and', ('eq', 'name', 'Sample'), ('gt', 'age', 18)), {'name': 'Sample', 'age': 19}),
+    (('or', ('lt', 'age', 10), ('eq', 'name', 'Sample')), {'name': 'Sample'}),
+    (('or', ('lt', 'age', 10), ('eq', 'name', 'Sample')), {'age': 'x'}),
+    (('not', ('ncontains', 'tags', 'A')), {}),
+    (('not', ('ncontains', 'tags', 'A')), {'tags': ['A']}),
+    (('in', 'tags', [['A'], 'B']), {'tags': ['A']}),
+    (('nin', 'tags', ['A', 'B']), {'tags': ['A']}),
+    (('in', 'name', 'Sample'), {'name': 'amp'}),
+    (('and',), {}),
+    (('or',), {}),
+    (None, {}),
+])
+def test_compiled_wt_same_as_check(w, value):
+    wq = parse_wt(w)
+    assert wq.compile()(value) is wq.check(value)
+
+
+def test_compiled_wt_short_circuits():
+    w = ('or',
+         ('eq', 'name', 'Sample'),
+         ('startswith', 'missing', 'A'))
+    predicate = compile_wt(w)
+    assert predicate({'name': 'Sample'}) is True
+    with pytest.raises(AttributeError):
+        predicate({'name': 'Other'})
+
+
+def _columns_from_records(np, records):
+    def _column(values):
+        if all(isinstance(v, (str, int, float)) for v in values):
+            return np.array(values)
+        column = np.empty(len(values), dtype=object)
+        for i, v in enumerate(values):
+            column[i] = v
+        return column
+    keys = {k for r in records for k in r}
+    return {k: _column([r.get(k) for r in records]) for k in keys}
+
+
+@pytest.mark.parametrize('w, value, result', simple_wt_cases)
+def test_filter_columns_simple(w, value, result):
+    np = pytest.importorskip('numpy')
+    mask = parse_wt(w).filter_columns(_columns_from_records(np, [value]))
+    assert mask.tolist() == [result]
+
+
+def test_filter_columns_same_as_check():
+    np = pytest.importorskip('numpy')
+    records = [
+        {'name': 'Sample', 'age': 18, 'tags': ['A']},
+        {'name': 'Example', 'age': 21, 'tags': []},
+        {'name': 'Sample Two', 'age': None, 'tags': ['B']},
+        {'name': 'Other', 'age': 5},
+    ]
+    wq = parse_wt(
+        ('or',
+         ('and',
+          ('startswith', 'name', 'Sample'),
+          ('not', ('lt', 'age', 10))),
+         ('in', 'age', [5, 21]),
+         ('contains', 'tags', 'B')))
+    mask = wq.filter_columns(_columns_from_records(np, records))
+    assert mask.tolist() == [wq.check(r) for r in records]
+    assert mask.tolist() == [True, True, True, True]
+    assert parse_wt(('gte', 'age', 18)).filter_columns(
+        _columns_from_records(np, records)).tolist() == [True, True, False, False]
+
+
+def test_filter_columns_numeric_arrays():
+    np = pytest.importorskip('numpy')
+    columns = {'age': np.arange(10), 'category': np.array(list('ABCDEABCDE'))}
+    wq = parse_wt(('and', ('gte', 'age', 3), ('nin', 'category', ['A', 'B'])))
+    assert np.flatnonzero(wq.filter_columns(columns)).tolist() == [3, 4, 7, 8, 9]
+    assert parse_wt(None).filter_columns(columns).all()
+
+
+def test_filter_columns_falls_back_to_check_for_incompatible_arguments():
+    np = pytest.importorskip('numpy')
+    records = [{'x': 0, 'tags': ['A', 'B']}, {'x': 1, 'tags': ['C']}, {'x': 2, 'tags': []}]
+    columns = {'x': np.arange(3), 'tags': _columns_from_records(np, records)['tags']}
+    for w in [('eq', 'x', [1]), ('neq', 'x', [1]), ('eq', 'tags', ['A', 'B']), ('neq', 'tags', ['A', 'B']),
+              ('in', 'x', [1, 'a']), ('nin', 'x', [1, 'a']), ('eq', 'x', '1'), ('in', 'x', [2 ** 70, 1])]:
+        wq = parse_wt(w)
+        assert wq.filter_columns(columns).tolist() == [wq.check(r) for r in records], w
+    assert parse_wt(('eq', 'tags', ['A', 'B'])).filter_columns(columns).tolist() == [True, False, False]
+    assert parse_wt(('in', 'x', [1, 'a'])).filter_columns(columns).tolist() == [False, True, False]
+
+
+def test_filter_columns_keeps_short_circuit_guards():
+    np = pytest.importorskip('numpy')
+    records = [{'kind': 'text', 'body': 'Abc'}, {'kind': 'number', 'body': 5}]
+    columns = {'kind': np.array(['text', 'number']), 'body': np.array(['Abc', 5], dtype=object)}
+    for w in [('and', ('eq', 'kind', 'text'), ('startswith', 'body', 'A')),
+              ('or', ('eq', 'kind', 'number'), ('startswith', 'body', 'A')),
+              ('not', ('and', ('neq', 'kind', 'number'), ('endswith', 'body', 'c')))]:
+        wq = parse_wt(w)
+        assert wq.filter_columns(columns).tolist() == [wq.check(r) for r in records], w
+    assert parse_wt(('and', ('eq', 'kind', 'text'), ('startswith', 'body', 'A'))).filter_columns(
+        columns).tolist() == [True, False]
+
+
+def test_optimize_flattens_and_drops_empty_queries():
+    w = ('and',
+         None,
+         ('and',
+          ('eq', 'name', 'Sample'),
+          ('and', ('gt', 'age', 18))))
+    assert optimize_wt(w) == parse_wt(('and', ('eq', 'name', 'Sample'), ('gt', 'age', 18)))
+    assert optimize_wt(('and', None, None)) == parse_wt(None)
+    assert optimize_wt(('or', ('eq', 'name', 'Sample'), None)) == parse_wt(None)
+    assert optimize_wt(('and', ('eq', 'name', 'Sample'))) == parse_wt(('eq', 'name', 'Sample'))
+
+
+def test_optimize_merges_equalities_into_set_lookup():
+    w = ('or',
+         ('eq', 'name', 'A'),
+         ('or', ('eq', 'name', 'B'), ('gt', 'age', 18)),
+         ('in', 'name', ['C']))
+    wq = optimize_wt(w)
+    assert wq == parse_wt(('or', ('in', 'name', frozenset(['A', 'B', 'C'])), ('gt', 'age', 18)))
+    for value in [{'name': 'B'}, {'name': 'D', 'age': 19}, {'name': ['A']}, {}]:
+        assert wq.check(value) is parse_wt(w).check(value)
+        assert wq.compile()(value) is parse_wt(w).check(value)
+
+
+def test_optimize_orders_by_cost_and_selectivity():
+    w = ('and',
+         ('contains', 'tags', 'rare'),
+         ('neq', 'name', 'S'),
+         ('gt', 'age', 18))
+    assert optimize_wt(w).to_list() == [
+        'and', ['neq', 'name', 'S'], ['gt', 'age', 18], ['contains', 'tags', 'rare']]
+
+    sample = [{'name': 'T', 'age': 30, 'tags': ['rare'] if i == 0 else []} for i in range(100)]
+    wq = optimize_wt(w, sample=sample)
+    assert wq.to_list()[1] == ['contains', 'tags', 'rare']
+    for value in sample:
+        assert wq.check(value) is parse_wt(w).check(value)
+
+
+def test_optimize_keeps_queries_which_may_raise_behind_their_guards():
+    w = ('and',
+         ('contains', 'tags', 'x'),
+         ('eq', 'kind', 'text'),
+         ('startswith', 'body', 'A'),
+         ('gt', 'size', 1),
+         ('eq', 'lang', 'en'))
+    sample = [{'kind': 'text', 'body': 'B', 'size': 2, 'lang': 'en', 'tags': ['x']} for _ in range(10)]
+    for wq in [optimize_wt(w), optimize_wt(w, sample=sample)]:
+        assert wq.to_list() == [
+            'and', ['eq', 'kind', 'text'], ['contains', 'tags', 'x'], ['startswith', 'body', 'A'],
+            ['gt', 'size', 1], ['eq', 'lang', 'en']]
+        for value in [{'kind': 'number', 'body': 5}, {'kind': 'text', 'body': 'Abc', 'size': 2, 'lang': 'en',
+                                                     'tags': ['x']}]:
+            assert wq.check(value) is wq.compile()(value) is parse_wt(w).check(value)
+    assert optimize_wt(('or', ('startswith', 'a', 'x'), ('eq', 'a', None))).to_list()[1][0] == 'startswith'
+
+
+def test_and_query_short_circuits():
+    wq = parse_wt(
+        ('and',
+         ('eq', 'name', 'Sample'),
+         ('startswith', 'missing', 'A')))
+    assert wq.check({'name': 'Other'}) is False
+
+
+sample_routing_rules = {
+    'eq': ('eq', 'type', 'order'),
+    'in': ('in', 'country', ['HU', 'AT']),
+    'prefix': ('startswith', 'path', '/api/'),
+    'suffix': ('endswith', 'path', '.json'),
+    'range': ('and', ('gte', 'amount', 100), ('lt', 'amount', 1000)),
+    'and': ('and', ('eq', 'type', 'order'), ('gt', 'amount', 500), ('contains', 'tags', 'vip')),
+    'or': ('or', ('eq', 'type', 'refund'), ('lte', 'amount', 0)),
+    'not': ('not', ('eq', 'type', 'order')),
+    'missing': ('eq', 'coupon', None),
+    'empty': None,
+}
+
+sample_events = [
+    {'path': ''},
+    {'type': 'order', 'amount': 600, 'tags': ['vip'], 'path': '/api/orders.json', 'coupon': 'X'},
+    {'type': 'order', 'amount': 99, 'country': 'AT', 'path': '/'},
+    {'type': 'refund', 'amount': -5, 'path': '/static/x.json'},
+    {'type': 'order', 'amount': 100.0, 'tags': [], 'country': ['HU'], 'path': '.json'},
+    {'type': ['order'], 'amount': 'many', 'path': 'api'},
+]
+
+
+@pytest.mark.parametrize('value', sample_events)
+def test_query_index_matches_same_as_check(value):
+    index = QueryIndex()
+    for key, w in sample_routing_rules.items():
+        index.add(key, w)
+    assert len(index) == len(sample_routing_rules)
+    assert index.match(value) == [key for key, w in sample_routing_rules.items() if parse_wt(w).check(value)]
+
+
+def test_query_index_only_checks_candidates():
+    index = QueryIndex()
+    for i in range(1000):
+        index.add(i, ('and', ('eq', 'user', i), ('gt', 'amount', 10)))
+    index.add('any', ('contains', 'tags', 'debug'))
+    assert len(index._unindexed) == 1
+    assert index.match({'user': 42, 'amount': 11}) == [42]
+    assert index.match({'user': 42, 'amount': 1, 'tags': ['debug']}) == ['any']
+
+
+def test_query_index_remove_and_replace():
+    index = QueryIndex()
+    index.add('a', ('lt', 'amount', 10))
+    index.add('b', ('lt', 'amount', 10))
+    index.add('c', ('startswith', 'path', '/api'))
+    index.remove('a')
+    assert 'a' not in index
+    assert index.match({'amount': 1}) == ['b']
+    index.add('b', ('eq', 'type', 'order'))
+    index.remove('c')
+    assert index.match({'amount': 1, 'path': '/api'}) == []
+    assert index.match({'type': 'order'}) == ['b']
+    index.remove('b')
+    assert index._hashes == {} and index._ranges == {} and index._affixes == {}
+
+
+def test_query_index_nan_arguments_are_not_indexed():
+    nan = float('nan')
+    rules = {0: ('gt', 'x', nan), 1: ('lt', 'x', 9), 2: ('lte', 'x', 8), 3: ('lt', 'x', nan), 4: ('gte', 'x', nan)}
+    index = QueryIndex()
+    for key, w in rules.items():
+        index.add(key, w)
+    assert index._unindexed == {0, 3, 4}
+    for value in [{'x': 7}, {'x': 8.5}, {'x': nan}, {'x': 100}]:
+        assert index.match(value) == [key for key, w in rules.items() if parse_wt(w).check(value)]
+    assert index.match({'x': 7}) == [1, 2]
+
+
+def test_query_index_matches_unhashable_values():
+    index = QueryIndex()
+    index.add('set', ('eq', 'x', frozenset({1})))
+    index.add('in', ('in', 'x', [(1, 2), 3]))
+    index.add('other', ('eq', 'x', 2))
+    assert index.match({'x': {1}}) == ['set']
+    assert index.match({'x': [1, 2]}) == []
+    assert index.match({'x': [3]}) == []
+
+
+sample_people = [
+    {'name': 'Alice', 'age': 31, 'city': 'Budapest', 'tags': ['admin']},
+    {'name': 'Bob', 'age': 17, 'city': 'Vienna', 'tags': []},
+    {'name': 'Albert', 'age': 45.0, 'city': 'Budapest', 'tags': []},
+    {'name': 'Carol', 'age': None, 'city': ['Budapest'], 'tags': ['admin']},
+    {'name': 'Alfred', 'age': float('nan'), 'city': 'Graz', 'tags': []},
+    {'name': '', 'age': '18', 'city': None, 'tags': []},
+]
+
+
+@pytest.mark.parametrize('w', [
+    ('eq', 'city', 'Budapest'),
+    ('in', 'city', ['Vienna', 'Graz']),
+    ('gte', 'age', 31),
+    ('lt', 'age', 31),
+    ('gt', 'age', '1'),
+    ('startswith', 'name', 'Al'),
+    ('startswith', 'name', ''),
+    ('and', ('startswith', 'name', 'Al'), ('lte', 'age', 45), ('contains', 'tags', 'admin')),
+    ('or', ('eq', 'city', 'Vienna'), ('gt', 'age', 40)),
+    ('or', ('eq', 'city', 'Vienna'), ('contains', 'tags', 'admin')),
+    ('not', ('eq', 'city', 'Budapest')),
+    None,
+])
+def test_indexed_collection_filter_same_as_predicate(w):
+    collection = IndexedCollection(sample_people, hash_indexes=['city'], sorted_indexes=['age', 'name'])
+    assert collection.filter(w) == list(filter(parse_wt(w).as_predicate(), sample_people))
+
+
+def test_indexed_collection_uses_indexes():
+    collection = IndexedCollection(sample_people, hash_indexes=['city'], sorted_indexes=['age', 'name'])
+    assert collection._candidates(parse_wt(('eq', 'city', 'Vienna'))) == {1, 3}
+    assert collection._candidates(parse_wt(('and', ('startswith', 'name', 'Al'), ('gt', 'age', 40)))) == {2, 4}
+    assert collection._candidates(parse_wt(('contains', 'tags', 'admin'))) is None
+
+
+def test_indexed_collection_incremental_updates():
+    collection = IndexedCollection(hash_indexes=['city'], sorted_indexes=['age'])
+    ids = [collection.insert(p) for p in sample_people]
+    collection.remove(ids[0])
+    collection.update(ids[1], {'name': 'Bob', 'age': 18, 'city': 'Budapest'})
+    collection.create_index('name', 'sorted')
+    assert len(collection) == len(sample_people) - 1
+    assert [p['name'] for p in collection.filter(('eq', 'city', 'Budapest'))] == ['Bob', 'Albert']
+    assert [p['name'] for p in collection.filter(('and', ('gte', 'age', 18), ('startswith', 'name', 'B')))] == ['Bob']
+    collection.remove(ids[3])
+    assert collection._hash_indexes['city']._unhashable == set()
+
+
+def test_indexed_collection_builds_indexes_in_bulk():
+    from centaur.queries import _SortedIndex
+    people = [dict(p, age=p['age'] if i % 3 else 31) for i, p in enumerate(sample_people * 10)]
+    with patch.object(_SortedIndex, 'add', side_effect=AssertionError('added one by one')):
+        collection = IndexedCollection(people, hash_indexes=['city'], sorted_indexes=['age', 'name'])
+    values, ids = collection._sorted_indexes['age']._buckets[int]
+    assert values == sorted(set(values)) == [17, 31, 45.0]
+    assert sum(map(len, ids.values())) == len([p for p in people if p['age'] in (17, 31, 45.0)])
+    for w in [('eq', 'age', 31), ('gte', 'age', 31), ('lt', 'age', 31), ('startswith', 'name', 'Al')]:
+        assert collection.filter(w) == [p for p in people if parse_wt(w).check(p)], w
+    item_ids = [i for i, p in collection._items.items() if p['age'] == 31]
+    for item_id in item_ids:
+        collection.remove(item_id)
+    assert 31 not in values and 31 not in ids
+    assert collection.filter(('eq', 'age', 31)) == []
+
+
+def test_indexed_collection_update_in_place():
+    collection = IndexedCollection([dict(p) for p in sample_people], hash_indexes=['city'], sorted_indexes=['age'])
+    item_id = next(i for i, p in collection._items.items() if p['name'] == 'Bob')
+    bob = collection.get(item_id)
+    bob.update(city='Budapest', age=50)
+    collection.update(item_id, bob)
+    for w in [('eq', 'city', 'Vienna'), ('eq', 'city', 'Budapest'), ('gt', 'age', 40), ('lt', 'age', 18)]:
+        assert collection.filter(w) == [p for p in collection if parse_wt(w).check(p)], w
+    assert [p['name'] for p in collection.filter(('gt', 'age', 40))] == ['Bob', 'Albert']
+    collection.remove(item_id)
+    assert collection.filter(('eq', 'city', 'Budapest')) == [p for p in collection if p['city'] == 'Budapest']